@@ -0,0 +1,80 @@
+'''
+Overloads a threaded server with more concurrent clients than
+its connection pool has connections, without admission control
+and with admission control sized to the pool, and reports the
+status codes and the latencies of the answered and of the shed
+requests. The rate limits are off, all the clients share an
+address.
+
+    python -m benchmarks.bench_admission --questions 100000 --concurrency 64
+'''
+import argparse
+import logging
+import threading
+from collections import Counter
+from werkzeug.serving import make_server
+
+from flaskr import limits
+from flaskr.models import db
+from .common import create_benchmark_app, summarize
+from .loadtest import run_scenario, scenarios
+from .seed import ensure_seeded
+
+
+def run(app, questions, concurrency, requests, pool_size, pool_timeout,
+        scenario):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(
+        pool_size=pool_size, max_overflow=0, pool_timeout=pool_timeout)
+    limits.init_limits(app)
+    limits.rate_limiter.store = None
+    with app.app_context():
+        state = {'category_ids': ensure_seeded(questions), 'pages': 1000}
+        db.session.remove()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+    modes = [
+        ('no admission control', 0),
+        ('admission limit {}'.format(pool_size), pool_size)
+    ]
+    try:
+        for name, limit in modes:
+            limits.admission_control = limits.AdmissionControl(limit=limit)
+            samples, statuses, elapsed = run_scenario(
+                base_url, scenarios[scenario], state, concurrency, requests)
+            answered = [
+                sample for sample, status in zip(samples, statuses)
+                if status == 200]
+            shed = [
+                sample for sample, status in zip(samples, statuses)
+                if status != 200]
+            print('{:<24} {:>7.1f} req/s  statuses {}'.format(
+                name, len(samples) / elapsed,
+                dict(sorted(Counter(statuses).items()))))
+            for label, values in (('answered', answered), ('shed', shed)):
+                if values:
+                    print('    {:<9} {}'.format(label, '  '.join(
+                        '{}={:.1f}ms'.format(key, value)
+                        for key, value in summarize(values).items()
+                        if key in ('p50', 'p99', 'max'))))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--pool-size', type=int, default=5)
+    parser.add_argument(
+        '--pool-timeout', type=float, default=2,
+        help='seconds a request waits for a connection before it fails')
+    parser.add_argument(
+        '--scenario', default='search_questions', choices=sorted(scenarios))
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    run(create_benchmark_app(args.database_url),
+        args.questions, args.concurrency, args.requests, args.pool_size,
+        args.pool_timeout, args.scenario)
@@ -0,0 +1,148 @@
+'''
+Compares the throughput of the Flask application served by a
+threaded WSGI server with the ASGI entry point served by
+uvicorn, one process each with the same number of database
+connections, under many concurrent clients playing quizzes
+and listing the questions of a category.
+
+    python -m benchmarks.bench_asgi --questions 1000000 --clients 500
+'''
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+
+from flaskr import api_url_prefix
+from flaskr.models import db
+from .common import BENCHMARK_DATABASE_URL, create_benchmark_app, summarize
+from .seed import ensure_seeded
+
+
+def serve(mode, database_url, port):
+    ''' runs the server of the given mode in this process '''
+    if mode == 'asgi':
+        import uvicorn
+        from flaskr.aio import create_asgi_app
+        uvicorn.run(
+            create_asgi_app(database_url), host='127.0.0.1', port=port,
+            log_level='warning', backlog=4096)
+    else:
+        import logging
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        server = make_server(
+            '127.0.0.1', port, create_benchmark_app(database_url),
+            threaded=True)
+        server.socket.listen(4096)
+        server.serve_forever()
+
+
+def build_request(generator, category_ids):
+    if generator.random() < 0.5:
+        body = json.dumps({
+            'previous_questions': [],
+            'quiz_category': {'id': generator.choice(category_ids)}
+        }).encode()
+        head = 'POST {}/quizzes'.format(api_url_prefix)
+    else:
+        body = b''
+        head = 'GET {}/categories/{}/questions'.format(
+            api_url_prefix, generator.choice(category_ids))
+    return (
+        '{} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+        'Content-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+    ).format(head, len(body)).encode() + body
+
+
+async def send(port, payload):
+    ''' sends one request on a new connection and returns
+        the status code of the response
+    '''
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(payload)
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def drive(port, clients, requests, category_ids):
+    samples, statuses = [], []
+    remaining = [requests]
+
+    async def client(number):
+        generator = random.Random(number)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            payload = build_request(generator, category_ids)
+            start = time.perf_counter()
+            try:
+                statuses.append(await send(port, payload))
+            except OSError:
+                statuses.append(0)
+            samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    return samples, statuses, time.perf_counter() - start
+
+
+async def wait_until_listening(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def run(database_url, questions, categories, clients, requests, port):
+    if not database_url.startswith('postgresql'):
+        sys.exit('the ASGI entry point needs a Postgres database')
+    app = create_benchmark_app(database_url)
+    with app.app_context():
+        category_ids = ensure_seeded(questions, categories)
+        db.session.remove()
+    for mode in ('wsgi', 'asgi'):
+        server = subprocess.Popen([
+            sys.executable, '-m', 'benchmarks.bench_asgi', '--serve', mode,
+            '--port', str(port), '--database-url', database_url])
+        try:
+            asyncio.run(wait_until_listening(port))
+            samples, statuses, elapsed = asyncio.run(
+                drive(port, clients, requests, category_ids))
+        finally:
+            server.terminate()
+            server.wait()
+        summary = summarize(samples)
+        print('{:<5} clients={} {:>8.1f} req/s  p50={:.1f}ms  p95={:.1f}ms  '
+              'p99={:.1f}ms  errors={}'.format(
+                  mode, clients, len(samples) / elapsed, summary['p50'],
+                  summary['p95'], summary['p99'],
+                  sum(1 for status in statuses if not 200 <= status < 300)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=1000000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--serve', choices=('wsgi', 'asgi'))
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    database_url = args.database_url or BENCHMARK_DATABASE_URL
+    if args.serve:
+        serve(args.serve, database_url, args.port)
+    else:
+        run(database_url, args.questions, args.categories, args.clients,
+            args.requests, args.port)
@@ -0,0 +1,128 @@
+'''
+Compares the ways of adding questions without storing the same
+one twice: looking the content hash up before inserting against
+a single INSERT ... ON CONFLICT DO NOTHING, for new and for
+duplicate questions, a retry answered from the stored result of
+its Idempotency-Key, and imports where half of the rows are
+already stored, with the plain COPY that stores them again and
+with the staged COPY that skips them.
+
+    python -m benchmarks.bench_dedupe --questions 1000000 --rows 10000
+'''
+import argparse
+import csv
+import io
+import itertools
+import json
+import time
+
+from flaskr import api_url_prefix
+from flaskr.idempotency import idempotent_requests, MemoryIdempotencyStore
+from flaskr.models import db, Question, question_content_hash
+from flaskr.questions import bulk
+from .common import create_benchmark_app, measure, print_summary
+from .seed import ensure_seeded
+
+numbers = itertools.count()
+
+
+def new_row(category_id):
+    question = 'Deduplicated question {}'.format(next(numbers))
+    return {
+        'question': question,
+        'answer': 'Answer',
+        'category': category_id,
+        'difficulty': 1,
+        'content_hash': question_content_hash(question, 'Answer')
+    }
+
+
+def read_then_write(row):
+    ''' the insert that looks for the stored question first '''
+    id = db.session.query(Question.id).filter(
+        Question.content_hash == row['content_hash']).scalar()
+    if id is None:
+        db.session.execute(Question.__table__.insert(), row)
+    db.session.commit()
+
+
+def insert_on_conflict(row):
+    bulk.insert_question(row)
+    db.session.commit()
+
+
+def remove_benchmark_questions():
+    db.session.query(Question).filter(
+        Question.question.like('Deduplicated question%')
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def run(app, questions, repeat, rows):
+    with app.app_context():
+        category_ids = ensure_seeded(questions)
+        stored = new_row(category_ids[0])
+        insert_on_conflict(stored)
+        for name, insert in (('read then write', read_then_write),
+                             ('insert on conflict', insert_on_conflict)):
+            print_summary('{}, new question'.format(name), measure(
+                lambda: insert(new_row(category_ids[0])), repeat=repeat))
+            print_summary('{}, duplicate question'.format(name), measure(
+                lambda: insert(stored), repeat=repeat))
+
+        idempotent_requests.store = MemoryIdempotencyStore()
+        client = app.test_client()
+        url = api_url_prefix + '/questions'
+
+        def add(headers):
+            body = dict(new_row(category_ids[0]))
+            del body['content_hash']
+            return client.post(url, data=json.dumps(body), headers=headers,
+                               content_type='application/json')
+
+        print_summary('POST /questions', measure(
+            lambda: add({}), repeat=repeat))
+        add({'Idempotency-Key': 'retried'})
+        print_summary('POST /questions, replayed key', measure(
+            lambda: add({'Idempotency-Key': 'retried'}), repeat=repeat))
+
+        if db.engine.dialect.name == 'postgresql':
+            half = [new_row(category_ids[0]) for _ in range(rows // 2)]
+            bulk.copy_rows(half)
+            db.session.commit()
+            for name, insert in (
+                    ('copy', copy_without_dedupe),
+                    ('staged copy on conflict', bulk.copy_rows)):
+                batch = half + [
+                    new_row(category_ids[0]) for _ in range(rows // 2)]
+                start = time.perf_counter()
+                insert(batch)
+                db.session.commit()
+                print('{:<40} {:.1f}ms for {} rows, half stored'.format(
+                    'import, ' + name,
+                    (time.perf_counter() - start) * 1000, rows))
+        remove_benchmark_questions()
+
+
+def copy_without_dedupe(rows):
+    ''' the COPY of the rows straight into the table, without
+        the content hashes that would conflict
+    '''
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [row[field] for field in bulk.question_fields] for row in rows)
+    buffer.seek(0)
+    db.session.connection().connection.cursor().copy_expert(
+        'COPY questions ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            ', '.join(bulk.question_fields)), buffer)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    run(create_benchmark_app(args.database_url),
+        args.questions, args.repeat, args.rows)
@@ -0,0 +1,90 @@
+'''
+Measures the peak memory (RSS) of exporting a growing number
+of questions with the streaming export, and with the old way
+of loading the rows and serializing them at once. Every
+export runs in its own process so that the peaks are
+independent.
+
+    python -m benchmarks.bench_export --questions 1000000 --sizes 100000 300000 1000000
+'''
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from flaskr import api_url_prefix
+from flaskr.models import db, Question
+from .common import create_benchmark_app
+from .seed import ensure_seeded
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def export_in_process(mode, size, database_url):
+    ''' exports the questions with an id up to `size`
+        and reports the peak RSS of this process
+    '''
+    app = create_benchmark_app(database_url)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'streaming':
+        client = app.test_client()
+        response = client.get(
+            '{}/questions/export?max_id={}'.format(api_url_prefix, size),
+            buffered=False)
+        written = sum(len(chunk) for chunk in response.response)
+        response.close()
+    else:
+        with app.app_context():
+            questions = Question.query.filter(Question.id <= size).all()
+            written = len(json.dumps(
+                [question.format() for question in questions]))
+    print(json.dumps({
+        'mode': mode,
+        'size': size,
+        'bytes': written,
+        'seconds': time.perf_counter() - start,
+        'peak_rss_mb': peak_rss_mb(),
+        'baseline_rss_mb': baseline
+    }))
+
+
+def run(questions, sizes, database_url):
+    app = create_benchmark_app(database_url)
+    with app.app_context():
+        ensure_seeded(questions)
+        db.session.remove()
+    for mode in ('load all', 'streaming'):
+        for size in sizes:
+            command = [
+                sys.executable, '-m', 'benchmarks.bench_export',
+                '--worker', mode, str(size)]
+            if database_url:
+                command += ['--database-url', database_url]
+            output = subprocess.run(
+                command, check=True, stdout=subprocess.PIPE).stdout
+            result = json.loads(output)
+            print('{:<10} {:>8} rows  {:>7.1f} MB written  {:6.2f}s  '
+                  'peak RSS {:7.1f} MB (baseline {:.1f} MB)'.format(
+                      mode, size, result['bytes'] / 2 ** 20,
+                      result['seconds'], result['peak_rss_mb'],
+                      result['baseline_rss_mb']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=1000000)
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[100000, 300000, 1000000])
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--worker', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        export_in_process(
+            args.worker[0], int(args.worker[1]), args.database_url)
+    else:
+        run(args.questions, args.sizes, args.database_url)
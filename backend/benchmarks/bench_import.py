@@ -0,0 +1,76 @@
+'''
+Compares adding questions one POST /questions request at
+a time with the bulk import, in rows per second.
+
+    python -m benchmarks.bench_import --rows 200000 --chunk-size 1000 5000
+'''
+import argparse
+import io
+import json
+import time
+
+from flaskr import api_url_prefix
+from flaskr.models import db, Question
+from flaskr.questions.bulk import import_questions, read_records
+from .common import create_benchmark_app
+from .seed import ensure_seeded
+
+
+def generate_lines(rows, category_ids):
+    return '\n'.join(
+        json.dumps({
+            'question': 'Imported question number {}'.format(n),
+            'answer': 'Answer {}'.format(n),
+            'category': category_ids[n % len(category_ids)],
+            'difficulty': 1 + n % 5
+        })
+        for n in range(rows)
+    ).encode()
+
+
+def remove_imported():
+    Question.query.filter(
+        Question.question.like('Imported question%')
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def report(name, rows, seconds):
+    print('{:<32} {:>9} rows in {:8.2f}s  {:>10.0f} rows/s'.format(
+        name, rows, seconds, rows / seconds))
+
+
+def run(app, rows, single_rows, chunk_sizes):
+    client = app.test_client()
+    with app.app_context():
+        category_ids = ensure_seeded(1000)
+        remove_imported()
+        start = time.perf_counter()
+        for line in generate_lines(single_rows, category_ids).splitlines():
+            client.post(
+                api_url_prefix + '/questions',
+                content_type='application/json', data=line)
+        report('POST /questions per row', single_rows,
+               time.perf_counter() - start)
+        remove_imported()
+        body = generate_lines(rows, category_ids)
+        for chunk_size in chunk_sizes:
+            start = time.perf_counter()
+            result = import_questions(
+                read_records(io.BytesIO(body), 'ndjson'), chunk_size)
+            assert result.total_errors == 0
+            report('bulk import, chunks of {}'.format(chunk_size), rows,
+                   time.perf_counter() - start)
+            remove_imported()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--single-rows', type=int, default=2000)
+    parser.add_argument(
+        '--chunk-size', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    run(create_benchmark_app(args.database_url),
+        args.rows, args.single_rows, args.chunk_size)
@@ -0,0 +1,70 @@
+'''
+Compares offset (page) pagination with keyset (cursor)
+pagination of GET /questions for the first page and
+a deep page.
+
+    python -m benchmarks.bench_pagination --questions 1000000 --page 10000
+'''
+import argparse
+
+from flaskr import api_url_prefix
+from flaskr.models import db, Question
+from flaskr.questions.pagination import paginate_questions
+from .common import create_benchmark_app, measure, print_summary
+from .seed import ensure_seeded
+
+
+def cursor_for_page(page, limit):
+    ''' returns the cursor that points at the same
+        questions as the given page number
+    '''
+    if page == 1:
+        return 0
+    return db.session.query(Question.id).order_by(Question.id).offset(
+        (page - 1) * limit - 1).limit(1).scalar()
+
+
+def page_query(app, query_string):
+    ''' runs only the pagination query, without the
+        count and serialization done by the endpoint
+    '''
+    with app.test_request_context('/questions?' + query_string):
+        paginate_questions(Question.query)
+        db.session.remove()
+
+
+def run(app, questions, page, limit, repeat):
+    client = app.test_client()
+    with app.app_context():
+        ensure_seeded(questions)
+        cursors = {
+            number: cursor_for_page(number, limit) for number in (1, page)
+        }
+        db.session.remove()
+    for number in (1, page):
+        page_url = '{}/questions?page={}&limit={}'.format(
+            api_url_prefix, number, limit)
+        cursor_url = '{}/questions?cursor={}&limit={}'.format(
+            api_url_prefix, cursors[number], limit)
+        assert (client.get(page_url).get_json()['questions'] ==
+                client.get(cursor_url).get_json()['questions'])
+        print_summary('endpoint, page={}'.format(number), measure(
+            lambda: client.get(page_url), repeat=repeat))
+        print_summary('endpoint, cursor for page={}'.format(number), measure(
+            lambda: client.get(cursor_url), repeat=repeat))
+        print_summary('query, page={}'.format(number), measure(
+            lambda: page_query(app, page_url.split('?')[1]), repeat=repeat))
+        print_summary('query, cursor for page={}'.format(number), measure(
+            lambda: page_query(app, cursor_url.split('?')[1]), repeat=repeat))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=1000000)
+    parser.add_argument('--page', type=int, default=10000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    run(create_benchmark_app(args.database_url),
+        args.questions, args.page, args.limit, args.repeat)
@@ -0,0 +1,56 @@
+'''
+Measures the size and the latency of pages of GET /questions
+with every question field and the categories, with some of the
+fields, and without the categories, sent as they are or
+compressed with gzip and brotli. The response cache is turned
+off so that every request renders its page, and the totals come
+from the in-memory counters so that the COUNT(*) of a large
+table does not hide the differences.
+
+    python -m benchmarks.bench_payload --questions 100000 --limit 100
+'''
+import argparse
+
+from flaskr import api_url_prefix, cache, compression
+from flaskr.questions import counts
+from .common import create_benchmark_app, measure, print_summary
+from .seed import ensure_seeded
+
+
+def run(app, questions, limit, repeat):
+    compression.init_compression(app)
+    with app.app_context():
+        ensure_seeded(questions)
+    cache.response_cache.store = None
+    counts.use_count_strategy('counter')
+    client = app.test_client()
+    pages = [
+        ('all fields', ''),
+        ('question and answer', '&fields=question,answer'),
+        ('all fields, no categories', '&include='),
+        ('question and answer, no categories',
+            '&fields=question,answer&include=')
+    ]
+    encodings = ['identity', 'gzip']
+    if compression.brotli is not None:
+        encodings.append('br')
+    for name, query_string in pages:
+        url = '{}/questions?page=2&limit={}{}'.format(
+            api_url_prefix, limit, query_string)
+        for encoding in encodings:
+            headers = {'Accept-Encoding': encoding}
+            size = len(client.get(url, headers=headers).data)
+            print_summary('{}, {}, {} bytes'.format(name, encoding, size),
+                          measure(lambda: client.get(url, headers=headers),
+                                  repeat=repeat))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    run(create_benchmark_app(args.database_url),
+        args.questions, args.limit, args.repeat)
@@ -0,0 +1,63 @@
+'''
+Compares the unpaginated LIKE search that POST /questions
+used to run with the paginated search backends.
+
+    python -m benchmarks.bench_search --questions 100000 1000000
+'''
+import argparse
+
+from flaskr.migrations import upgrade
+from flaskr.models import db, Question
+from flaskr.questions import search
+from flaskr.serializers import format_rows
+from .common import create_benchmark_app, measure, print_summary
+from .seed import ensure_seeded
+
+
+TERMS = ['number 123456', 'number 99']
+
+
+def legacy_search(term):
+    search_format = '%{}%'.format(term.lower())
+    questions = Question.query.filter(
+        db.func.lower(Question.question).like(search_format)).all()
+    return [question.format() for question in questions], len(questions)
+
+
+def paginated_search(backend, term, limit=10):
+    search.search_backends[db.engine] = backend
+    questions, total = search.search_questions(term, 1, limit)
+    return format_rows(questions), total
+
+
+def run(sizes, repeat):
+    for size in sizes:
+        ensure_seeded(size)
+        upgrade()
+        for term in TERMS:
+            cases = [
+                ('legacy', lambda: legacy_search(term)),
+                ('like, page of 10',
+                    lambda: paginated_search(search.LikeSearch(), term))
+            ]
+            if db.engine.dialect.name == 'postgresql':
+                cases.append(('full text, page of 10', lambda: paginated_search(
+                    search.FullTextSearch(), term)))
+            for name, function in cases:
+                def call():
+                    function()
+                    db.session.remove()
+                print_summary('{} questions, "{}", {}'.format(
+                    size, term, name), measure(call, repeat=repeat, warmup=1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--questions', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    app = create_benchmark_app(args.database_url)
+    with app.app_context():
+        run(args.questions, args.repeat)
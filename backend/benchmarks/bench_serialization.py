@@ -0,0 +1,65 @@
+'''
+Compares the ways of turning a page of 1,000 questions into a
+JSON response: ORM objects with Question.format() and jsonify,
+and column tuples encoded by the stdlib or by orjson.
+
+    python -m benchmarks.bench_serialization --questions 100000 --limit 1000
+'''
+import argparse
+from flask import jsonify
+
+from flaskr import serializers
+from flaskr.models import db, Question
+from flaskr.serializers import question_rows, format_rows, json_response
+from .common import create_benchmark_app, measure, print_summary
+from .seed import ensure_seeded
+
+
+def orm_page(limit):
+    questions = Question.query.order_by(Question.id).limit(limit).all()
+    return {'questions': [question.format() for question in questions]}
+
+
+def row_page(limit):
+    rows = question_rows().order_by(Question.id).limit(limit).all()
+    return {'questions': format_rows(rows)}
+
+
+def run(app, questions, limit, repeat):
+    with app.app_context():
+        ensure_seeded(questions)
+    orjson = serializers.orjson
+    with app.test_request_context():
+        assert jsonify(orm_page(limit)).data == json_response(
+            row_page(limit)).data
+        cases = [
+            ('ORM objects, format(), jsonify',
+                lambda: jsonify(orm_page(limit))),
+            ('column tuples, jsonify',
+                lambda: jsonify(row_page(limit))),
+            ('column tuples, json_response',
+                lambda: json_response(row_page(limit))),
+        ]
+        for name, function in cases:
+            print_summary(name, measure(function, repeat=repeat))
+            db.session.remove()
+        # the encoding alone, on the same page
+        page = row_page(limit)
+        serializers.orjson = None
+        print_summary('encoding only, stdlib', measure(
+            lambda: json_response(page), repeat=repeat))
+        serializers.orjson = orjson
+        if orjson is not None:
+            print_summary('encoding only, orjson', measure(
+                lambda: json_response(page), repeat=repeat))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    run(create_benchmark_app(args.database_url),
+        args.questions, args.limit, args.repeat)
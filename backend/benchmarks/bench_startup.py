@@ -0,0 +1,113 @@
+'''
+Measures the cold start of the application: the time from
+starting a new server process until it answers its first
+request. The Flask application is started with and without
+creating the schema, and, when gunicorn is installed, with
+several workers with and without preloading. The servers use
+the database of the DATABASE_* environment variables.
+
+    python -m benchmarks.bench_startup --repeat 10 --workers 4
+'''
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# the server processes run this module too, it imports flaskr
+# only in the functions so that serve() measures the import
+
+
+def serve(port):
+    ''' runs the application in this process and reports how
+        long importing it and creating it took
+    '''
+    start = time.perf_counter()
+    from werkzeug.serving import make_server
+    from flaskr import create_app
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+    print('{:.3f} {:.3f}'.format(
+        (imported - start) * 1000, (created - imported) * 1000), flush=True)
+    make_server('127.0.0.1', port, app).serve_forever()
+
+
+def wait_for_first_response(port, timeout=60):
+    from flaskr import api_url_prefix
+    url = 'http://127.0.0.1:{}{}/categories'.format(port, api_url_prefix)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(url).close()
+            return
+        except urllib.error.HTTPError:
+            # an error status is still an answer
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.005)
+
+
+def startup_modes(port, workers):
+    flask = [
+        sys.executable, '-m', 'benchmarks.bench_startup', '--serve',
+        '--port', str(port)]
+    modes = [
+        ('flask, create schema', flask, 'true'),
+        ('flask, no schema', flask, 'false')
+    ]
+    if importlib.util.find_spec('gunicorn') is not None:
+        gunicorn = [
+            sys.executable, '-m', 'gunicorn', '--bind',
+            '127.0.0.1:{}'.format(port), '--workers', str(workers)]
+        modes.extend([
+            ('gunicorn -w {}, no preload'.format(workers), gunicorn + [
+                '--config', os.devnull, 'flaskr:create_app()'], 'false'),
+            ('gunicorn -w {}, preload'.format(workers), gunicorn + [
+                '--config', 'gunicorn.conf.py', 'flaskr:create_app()'],
+                'false')
+        ])
+    return modes
+
+
+def run(repeat, port, workers):
+    from .common import print_summary
+    for name, command, create_schema in startup_modes(port, workers):
+        environment = dict(os.environ, DATABASE_CREATE_SCHEMA=create_schema)
+        samples, imports, creations = [], [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            server = subprocess.Popen(
+                command, env=environment, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL)
+            try:
+                wait_for_first_response(port)
+                samples.append((time.perf_counter() - start) * 1000)
+            finally:
+                server.terminate()
+                output = server.communicate()[0].split()
+            if output:
+                imports.append(float(output[0]))
+                creations.append(float(output[1]))
+        print_summary('{}, first request'.format(name), samples)
+        if imports:
+            print_summary('{}, import'.format(name), imports)
+            print_summary('{}, create_app'.format(name), creations)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--serve', action='store_true')
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.port)
+    else:
+        run(args.repeat, args.port, args.workers)
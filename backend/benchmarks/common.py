@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+from flask import Flask
+
+from flaskr import api_url_prefix
+from flaskr.migrations import upgrade
+from flaskr.models import setup_db
+from flaskr.questions.views import question
+
+
+BENCHMARK_DATABASE_URL = os.getenv(
+    'BENCHMARK_DATABASE_URL',
+    'sqlite:///{}'.format(
+        os.path.join(tempfile.gettempdir(), 'trivia_benchmark.db')))
+
+
+def create_benchmark_app(database_url=None):
+    ''' creates an application bound to the benchmark
+        database, migrated to the current schema, with the
+        question blueprint but without the handlers registered
+        by create_app
+    '''
+    app = Flask('benchmarks')
+    setup_db(app, database_url or BENCHMARK_DATABASE_URL, create_schema=False)
+    with app.app_context():
+        upgrade()
+    app.register_blueprint(question, url_prefix=api_url_prefix)
+    return app
+
+
+def measure(function, repeat=100, warmup=5):
+    ''' calls the function `repeat` times and returns the
+        duration of every call in milliseconds
+    '''
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * len(ordered))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'min': min(samples),
+        'mean': sum(samples) / len(samples),
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'max': max(samples)
+    }
+
+
+def print_summary(name, samples):
+    print('{:<40} {}'.format(name, '  '.join(
+        '{}={:.3f}ms'.format(key, value)
+        for key, value in summarize(samples).items())))
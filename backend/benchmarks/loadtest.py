@@ -0,0 +1,279 @@
+'''
+Load test of the question blueprint. The application is
+served by a threaded WSGI server and every route is driven
+by a pool of concurrent clients, one concurrency level after
+the other. Latency percentiles and requests per second are
+printed and written to a JSON file named after the current
+version, so that runs of different versions can be compared.
+
+    python -m benchmarks.loadtest --questions 100000 --concurrency 1,8,32
+    python -m benchmarks.loadtest --compare loadtest-a1b2c3d.json loadtest-e4f5a6b.json
+'''
+import argparse
+import json
+import logging
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from werkzeug.serving import make_server
+
+from flaskr import api_url_prefix
+from flaskr.models import db, Question
+from .common import create_benchmark_app, summarize
+from .seed import ensure_seeded
+
+
+'''
+Scenarios
+    build the request of one call to a route. They receive
+    the random generator of the calling client and the state
+    of the run, and return a (method, path, body) tuple.
+'''
+
+
+def list_questions(generator, state):
+    page = generator.randint(1, state['pages'])
+    return 'GET', '/questions?page={}'.format(page), None
+
+
+def list_categories(generator, state):
+    return 'GET', '/categories', None
+
+
+def list_category_questions(generator, state):
+    category = generator.choice(state['category_ids'])
+    return 'GET', '/categories/{}/questions'.format(category), None
+
+
+def search_questions(generator, state):
+    term = 'question number {}'.format(generator.randint(1, 999))
+    return 'POST', '/questions', {'searchTerm': term}
+
+
+def add_question(generator, state):
+    # a question that is already stored would not be inserted
+    return 'POST', '/questions', {
+        'question': 'Load test question {}'.format(generator.getrandbits(64)),
+        'answer': 'Load test answer',
+        'category': generator.choice(state['category_ids']),
+        'difficulty': generator.randint(1, 5)
+    }
+
+
+def delete_question(generator, state):
+    return 'DELETE', '/questions/{}'.format(state['deletable'].pop()), None
+
+
+def play_quiz(generator, state):
+    return 'POST', '/quizzes', {
+        'previous_questions': [],
+        'quiz_category': {'id': generator.choice(state['category_ids'])}
+    }
+
+
+scenarios = {
+    'list_questions': list_questions,
+    'list_categories': list_categories,
+    'list_category_questions': list_category_questions,
+    'search_questions': search_questions,
+    'add_question': add_question,
+    'delete_question': delete_question,
+    'play_quiz': play_quiz
+}
+
+
+def current_version():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def send(base_url, method, path, body):
+    ''' sends a request and returns its status code,
+        error responses are part of the measurement
+    '''
+    data = None if body is None else json.dumps(body).encode()
+    request = urllib.request.Request(
+        base_url + api_url_prefix + path, data=data, method=method,
+        headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def create_deletable_questions(app, amount):
+    ''' inserts the questions removed by the delete scenario '''
+    with app.app_context():
+        db.session.execute(Question.__table__.insert(), [
+            {
+                'question': 'Load test question to delete',
+                'answer': 'Load test answer',
+                'difficulty': 1
+            }
+            for _ in range(amount)
+        ])
+        ids = [
+            row.id for row in db.session.query(Question.id).filter(
+                Question.question == 'Load test question to delete')
+        ]
+        db.session.commit()
+        db.session.remove()
+    return ids
+
+
+def remove_added_questions(app):
+    with app.app_context():
+        db.session.query(Question).filter(
+            Question.question.like('Load test question%')
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        db.session.remove()
+
+
+def run_scenario(base_url, scenario, state, concurrency, requests):
+    ''' sends `requests` requests built by the scenario from
+        `concurrency` clients and returns the latencies in
+        milliseconds, the status codes and the wall time
+    '''
+    per_client = [requests // concurrency] * concurrency
+    for client in range(requests % concurrency):
+        per_client[client] += 1
+
+    def client(number):
+        generator = random.Random(number)
+        samples, statuses = [], []
+        for _ in range(per_client[number]):
+            method, path, body = scenario(generator, state)
+            start = time.perf_counter()
+            statuses.append(send(base_url, method, path, body))
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples, statuses
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    samples = [sample for outcome in outcomes for sample in outcome[0]]
+    statuses = [status for outcome in outcomes for status in outcome[1]]
+    return samples, statuses, elapsed
+
+
+def report(name, concurrency, samples, statuses, elapsed):
+    summary = summarize(samples)
+    result = {
+        'scenario': name,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': sum(1 for status in statuses if status >= 400),
+        'rps': len(samples) / elapsed,
+        'p50': summary['p50'],
+        'p95': summary['p95'],
+        'p99': summary['p99'],
+        'max': summary['max']
+    }
+    print('{scenario:<26} c={concurrency:<4} {rps:>9.1f} req/s  '
+          'p50={p50:.2f}ms  p95={p95:.2f}ms  p99={p99:.2f}ms  '
+          'errors={errors}'.format(**result))
+    return result
+
+
+def run(app, questions, categories, levels, requests, names, output):
+    with app.app_context():
+        category_ids = ensure_seeded(questions, categories)
+        db.session.remove()
+    state = {
+        'category_ids': category_ids,
+        'pages': max(1, min(questions // 10, 1000))
+    }
+    # the access log of every request would dominate the output
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+    results = []
+    try:
+        for concurrency in levels:
+            for name in names:
+                if name == 'delete_question':
+                    state['deletable'] = create_deletable_questions(
+                        app, requests)
+                samples, statuses, elapsed = run_scenario(
+                    base_url, scenarios[name], state, concurrency, requests)
+                results.append(report(
+                    name, concurrency, samples, statuses, elapsed))
+    finally:
+        server.shutdown()
+        remove_added_questions(app)
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    document = {
+        'version': current_version(),
+        'date': datetime.now(timezone.utc).isoformat(),
+        'database': dialect,
+        'questions': questions,
+        'categories': categories,
+        'requests': requests,
+        'results': results
+    }
+    output = output or 'loadtest-{}.json'.format(document['version'])
+    with open(output, 'w') as file:
+        json.dump(document, file, indent=2)
+    print('results written to {}'.format(output))
+
+
+def compare(baseline_path, candidate_path):
+    ''' prints the change of throughput and p99 latency
+        between two result files
+    '''
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    with open(candidate_path) as file:
+        candidate = json.load(file)
+    print('{} -> {}'.format(baseline['version'], candidate['version']))
+    before = {
+        (result['scenario'], result['concurrency']): result
+        for result in baseline['results']
+    }
+    for result in candidate['results']:
+        key = (result['scenario'], result['concurrency'])
+        if key not in before:
+            continue
+        old = before[key]
+        print('{:<26} c={:<4} rps {:>9.1f} -> {:>9.1f}  '
+              'p99 {:>8.2f}ms -> {:>8.2f}ms'.format(
+                  key[0], key[1], old['rps'], result['rps'],
+                  old['p99'], result['p99']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument(
+        '--scenarios', default=','.join(scenarios),
+        help='comma separated names out of ' + ', '.join(scenarios))
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'))
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(create_benchmark_app(args.database_url),
+            args.questions, args.categories,
+            [int(level) for level in args.concurrency.split(',')],
+            args.requests, args.scenarios.split(','), args.output)
@@ -0,0 +1,106 @@
+'''
+Seeds the benchmark database with generated categories
+and questions.
+
+    python -m benchmarks.seed --questions 1000000 --categories 6
+'''
+import argparse
+import random
+
+from flaskr.models import db, Question, Category, question_content_hash
+from .common import create_benchmark_app
+
+
+def reset_tables():
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(
+            'TRUNCATE questions, categories RESTART IDENTITY CASCADE')
+    else:
+        db.session.query(Question).delete()
+        db.session.query(Category).delete()
+    db.session.commit()
+
+
+def seed_database(questions, categories=6, chunk_size=10000):
+    ''' replaces the contents of the questions and categories
+        tables with `questions` generated questions spread
+        evenly over `categories` categories
+    '''
+    reset_tables()
+    db.session.execute(Category.__table__.insert(), [
+        {'type': 'Category {}'.format(number)}
+        for number in range(1, categories + 1)
+    ])
+    category_ids = [
+        row.id for row in db.session.query(Category.id).order_by(Category.id)
+    ]
+    if db.engine.dialect.name == 'postgresql':
+        # generate the rows server side, it is much faster than
+        # sending a million rows over the wire. The generated text
+        # is already normalized, its md5 is question_content_hash
+        db.session.execute(
+            "INSERT INTO questions "
+            "(question, answer, category, difficulty, content_hash) "
+            "SELECT 'Generated question number ' || n, 'Answer ' || n, "
+            ":first_category + (n % :categories), 1 + (n % 5), "
+            "md5('generated question number ' || n || chr(31) "
+            "|| 'answer ' || n) "
+            "FROM generate_series(1, :questions) AS n",
+            {
+                'first_category': category_ids[0],
+                'categories': categories,
+                'questions': questions
+            })
+    else:
+        generator = random.Random(0)
+        for start in range(0, questions, chunk_size):
+            db.session.execute(Question.__table__.insert(), [
+                {
+                    'question': 'Generated question number {}'.format(n),
+                    'answer': 'Answer {}'.format(n),
+                    'category': category_ids[n % categories],
+                    'difficulty': generator.randint(1, 5),
+                    'content_hash': question_content_hash(
+                        'Generated question number {}'.format(n),
+                        'Answer {}'.format(n))
+                }
+                for n in range(start, min(start + chunk_size, questions))
+            ])
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute('ANALYZE questions')
+        db.session.execute('ANALYZE categories')
+        db.session.commit()
+    return category_ids
+
+
+def question_count():
+    return db.session.query(db.func.count(Question.id)).scalar()
+
+
+def ensure_seeded(questions, categories=6):
+    ''' seeds the database unless it already holds exactly
+        `questions` questions and `categories` categories
+    '''
+    category_count = db.session.query(db.func.count(Category.id)).scalar()
+    if question_count() != questions or category_count != categories:
+        seed_database(questions, categories)
+    category_ids = [
+        row.id for row in db.session.query(Category.id).order_by(Category.id)
+    ]
+    # end the transaction so that it holds no locks on the tables
+    db.session.commit()
+    return category_ids
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    app = create_benchmark_app(args.database_url)
+    with app.app_context():
+        seed_database(args.questions, args.categories)
+        print('seeded {} questions in {} categories'.format(
+            question_count(), args.categories))
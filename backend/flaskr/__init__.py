@@ -1,11 +1,20 @@
-from flask import Flask, jsonify
+from flask import Flask, g, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+from .commands import register_commands
+from .compression import init_compression
+from .instrumentation import init_instrumentation
+from .internal.views import internal
+from .limits import init_limits
 from .models import setup_db
+from .questions.index import init_question_index
+from .questions.views import question
+from .replicas import init_replicas
 
 
 api_url_prefix = '/api/v1'
+internal_url_prefix = '/internal'
 # load environment variables
 load_dotenv()
 
@@ -13,12 +22,18 @@ load_dotenv()
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    # the test config holds the arguments of setup_db
+    setup_db(app, **(test_config or {}))
 
     # register blue prints for routes
-    from .questions.views import question
-
     app.register_blueprint(question, url_prefix=api_url_prefix)
+    app.register_blueprint(internal, url_prefix=internal_url_prefix)
+    register_commands(app)
+    init_instrumentation(app)
+    init_limits(app)
+    init_compression(app)
+    init_replicas(app)
+    init_question_index(app)
 
     # set up CORS
     CORS(app, resource={r'/api/*': {'origins': '*'}})
@@ -59,6 +74,14 @@ def create_app(test_config=None):
           'message': 'bad request'
         }), 400
 
+    @app.errorhandler(409)
+    def conflict(error):
+        return jsonify({
+          'success': False,
+          'error': 409,
+          'message': 'request in progress'
+        }), 409
+
     @app.errorhandler(422)
     def unprocessable_request(error):
         return jsonify({
@@ -67,6 +90,28 @@ def create_app(test_config=None):
           'message': 'unable to process request'
         }), 422
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        response = jsonify({
+          'success': False,
+          'error': 429,
+          'message': 'too many requests'
+        })
+        if 'retry_after' in g:
+            response.headers['Retry-After'] = str(g.retry_after)
+        return response, 429
+
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        response = jsonify({
+          'success': False,
+          'error': 503,
+          'message': 'service unavailable'
+        })
+        if 'retry_after' in g:
+            response.headers['Retry-After'] = str(g.retry_after)
+        return response, 503
+
     return app
 
     @app.errorhandler(500)
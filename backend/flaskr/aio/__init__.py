@@ -0,0 +1,24 @@
+from .. import api_url_prefix
+from .app import AsgiApp
+from .views import register_routes
+
+'''
+ASGI entry point
+    serves the routes of the question blueprint from an event
+    loop with asyncpg, for traffic that mostly waits on the
+    database. Run it with any ASGI server, for instance
+
+        uvicorn flaskr.aio:app --workers 4
+
+    Bulk import and export, quiz sessions and the internal
+    endpoints are only served by the Flask application.
+'''
+
+
+def create_asgi_app(database_url=None):
+    app = AsgiApp(database_url, url_prefix=api_url_prefix)
+    register_routes(app)
+    return app
+
+
+app = create_asgi_app()
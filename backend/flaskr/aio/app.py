@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import re
+from urllib.parse import parse_qs
+
+from ..backends import create_asyncpg_pool
+from ..models import (
+    database_path, database_pool_size, database_max_overflow)
+
+'''
+AsgiApp
+    a minimal ASGI application that serves the routes of the
+    question blueprint with an asyncpg connection pool, so that
+    one worker can wait on many queries at the same time.
+    Responses are encoded like jsonify and errors have the same
+    format as the error handlers of create_app.
+'''
+
+logger = logging.getLogger(__name__)
+
+error_messages = {
+    400: 'bad request',
+    404: 'resource not found',
+    405: 'method not allowed',
+    422: 'unable to process request',
+    500: 'internal server error',
+    501: 'not implemented'
+}
+
+
+# the headers that CORS and the after_request hook of create_app add
+cors_headers = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type, Authorization'),
+    (b'access-control-allow-methods',
+     b'GET, POST, PUT, PATCH, DELETE, OPTIONS')
+]
+
+
+class HTTPError(Exception):
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def abort(code):
+    raise HTTPError(code)
+
+
+class Request:
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = {
+            name: values[0] for name, values in parse_qs(
+                scope.get('query_string', b'').decode('latin-1'),
+                keep_blank_values=True).items()
+        }
+        self.headers = {
+            name.decode('latin-1').lower(): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        self.data = body
+
+    def arg(self, name, default=None, type=int):
+        ''' reads a query string argument like request.args.get,
+            values that cannot be converted give the default
+        '''
+        if name not in self.args:
+            return default
+        try:
+            return type(self.args[name])
+        except ValueError:
+            return default
+
+    def json(self):
+        return json.loads(self.data)
+
+
+def encode(data):
+    ''' encodes a response body the same way as jsonify '''
+    return (json.dumps(
+        data, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+class AsgiApp:
+
+    def __init__(self, database_url=None, url_prefix=''):
+        self.database_url = database_url or database_path
+        self.url_prefix = url_prefix
+        self.routes = []
+        self.pool = None
+        self._opening = None
+
+    def route(self, method, pattern):
+        ''' registers a handler for the method and the path
+            pattern, in which <int:name> matches an integer and
+            <name> any other path segment
+        '''
+        integers = set(re.findall(r'<int:(\w+)>', pattern))
+        pattern = re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', pattern)
+        regex = re.compile('^{}{}$'.format(
+            re.escape(self.url_prefix),
+            re.sub(r'<int:(\w+)>', r'(?P<\1>[0-9]+)', pattern)))
+
+        def register(handler):
+            self.routes.append((method, regex, integers, handler))
+            return handler
+        return register
+
+    def match(self, method, path):
+        allowed = False
+        for route_method, regex, integers, handler in self.routes:
+            found = regex.match(path)
+            if found is None:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            return handler, {
+                name: int(value) if name in integers else value
+                for name, value in found.groupdict().items()
+            }
+        abort(405 if allowed else 404)
+
+    async def startup(self):
+        if self.pool is None:
+            # concurrent first requests wait for the same pool
+            if self._opening is None:
+                self._opening = asyncio.ensure_future(create_asyncpg_pool(
+                    self.database_url, min_size=1,
+                    max_size=database_pool_size + database_max_overflow))
+            self.pool = await self._opening
+
+    async def shutdown(self):
+        if self.pool is not None:
+            await self.pool.close()
+        self.pool = None
+        self._opening = None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    async def handle(self, request):
+        try:
+            handler, arguments = self.match(request.method, request.path)
+            # servers without lifespan support open the pool lazily
+            await self.startup()
+            async with self.pool.acquire() as connection:
+                return await handler(request, connection, **arguments)
+        except HTTPError as error:
+            code = error.code
+        except Exception:
+            logger.exception('%s %s failed', request.method, request.path)
+            code = 500
+        return {
+            'success': False,
+            'error': code,
+            'message': error_messages[code]
+        }, code
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        request = Request(scope, await self.read_body(receive))
+        data, status = await self.handle(request)
+        body = encode(data)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode())
+            ] + cors_headers
+        })
+        await send({'type': 'http.response.body', 'body': body})
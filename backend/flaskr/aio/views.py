@@ -0,0 +1,395 @@
+import random
+import re
+from collections import Counter
+
+from ..models import question_content_hash
+from ..questions.difficulty import distribution, range_conditions
+from ..questions.helpers import (
+    isValidDifficulty, isValidFields, isValidInclude, isValidQuestion,
+    isValidQuizBatch, isValidQuizRequest, isValidPage)
+from ..questions.pagination import (
+    QUESTIONS_PER_PAGE, QUESTIONS_MAX_PER_PAGE, listing_parts)
+from ..questions.quiz import (
+    ALL_CATEGORIES, QUIZ_SEED_LIMIT, available_conditions,
+    quiz_sample_statement, quiz_top_up_statement, top_up_rows)
+from ..questions.search import (
+    escape_like, search_index_name, search_configuration)
+from ..serializers import question_fields, selected_fields
+from .app import abort
+
+'''
+The routes of the question blueprint written against asyncpg.
+Every handler receives the request, a pooled connection and
+the arguments of its path, and returns the response body with
+its status code. The queries are the ones that the ORM issues
+for the synchronous views. The routes that only the Flask
+application serves, and the Idempotency-Key header, are
+answered with a 501.
+'''
+
+question_columns = 'id, question, answer, category, difficulty'
+
+# the routes of the question blueprint that are not ported
+flask_only_routes = [
+    ('GET', '/questions/export'),
+    ('POST', '/questions/import'),
+    ('DELETE', '/questions'),
+    ('PATCH', '/questions'),
+    ('POST', '/quiz-sessions'),
+    ('POST', '/quiz-sessions/<session_id>/next'),
+    ('DELETE', '/quiz-sessions/<session_id>')
+]
+
+
+def format_question(row, fields=question_fields):
+    return {field: row[field] for field in fields}
+
+
+def requested_names(request, argument, default):
+    ''' the names in a comma separated query string argument '''
+    value = request.arg(argument, type=str)
+    if value is None:
+        return list(default)
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def requested_fields(request):
+    ''' the question fields that a listing selects, or a 400 '''
+    fields = requested_names(request, 'fields', question_fields)
+    if not isValidFields(fields):
+        abort(400)
+    return selected_fields(fields)
+
+
+def format_category(row):
+    return {'id': row['id'], 'type': row['type']}
+
+
+async def paginate_questions(request, connection, fields, category=None):
+    ''' the keyset or offset pagination of paginate_questions '''
+    limit = request.arg('limit', QUESTIONS_PER_PAGE)
+    page = request.arg('page', 1)
+    if not (0 < limit <= QUESTIONS_MAX_PER_PAGE and page > 0):
+        abort(400)
+    cursor = request.arg('cursor')
+    if cursor is None:
+        cursor = request.arg('after_id')
+    conditions, parameters = [], []
+    if category is not None:
+        parameters.append(category)
+        conditions.append('category = ${}'.format(len(parameters)))
+    offset = 0
+    if cursor is not None:
+        parameters.append(cursor)
+        conditions.append('id > ${}'.format(len(parameters)))
+    else:
+        offset = (page - 1) * limit
+    parameters.extend((limit + 1, offset))
+    rows = await connection.fetch(
+        'SELECT {} FROM questions {} ORDER BY id LIMIT ${} OFFSET ${}'.format(
+            ', '.join(fields),
+            'WHERE ' + ' AND '.join(conditions) if conditions else '',
+            len(parameters) - 1, len(parameters)),
+        *parameters)
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return [format_question(row, fields) for row in rows[:limit]], next_cursor
+
+
+async def count_questions(connection, category=None):
+    if category is None:
+        return await connection.fetchval('SELECT count(*) FROM questions')
+    return await connection.fetchval(
+        'SELECT count(*) FROM questions WHERE category = $1', category)
+
+
+async def has_search_index(connection):
+    return bool(await connection.fetchval(
+        'SELECT 1 FROM pg_indexes WHERE indexname = $1', search_index_name))
+
+
+async def search_questions(connection, term, page, limit, indexed):
+    ''' the full text or substring search of search_questions '''
+    words = re.findall(r'\w+', term)
+    if words and indexed:
+        query = ' & '.join('{}:*'.format(word) for word in words)
+        document = "to_tsvector('{}', question)".format(search_configuration)
+        condition = "{} @@ to_tsquery('{}', $1)".format(
+            document, search_configuration)
+        ordering = "ts_rank({}, to_tsquery('{}', $1)) DESC, id".format(
+            document, search_configuration)
+    else:
+        query = '%{}%'.format(escape_like(term.lower()))
+        condition = "lower(question) LIKE $1 ESCAPE '\\'"
+        ordering = 'id'
+    total = await connection.fetchval(
+        'SELECT count(*) FROM questions WHERE ' + condition, query)
+    rows = await connection.fetch(
+        'SELECT {} FROM questions WHERE {} ORDER BY {} '
+        'LIMIT $2 OFFSET $3'.format(question_columns, condition, ordering),
+        query, limit, (page - 1) * limit)
+    return [format_question(row) for row in rows], total
+
+
+async def fetch(connection, statement, parameters):
+    ''' runs a statement written for the ORM, with :name
+        parameters, numbering them for asyncpg. The lists are
+        compared with ALL.
+    '''
+    values, numbers = [], {}
+
+    def number(name):
+        if name not in numbers:
+            values.append(parameters[name])
+            numbers[name] = '${}'.format(len(values))
+        return numbers[name]
+    statement = re.sub(
+        r'NOT IN :(\w+)',
+        lambda found: '<> ALL({})'.format(number(found.group(1))),
+        statement)
+    statement = re.sub(
+        r'(?<![:\w]):(\w+)', lambda found: number(found.group(1)),
+        statement)
+    return await connection.fetch(statement, *values)
+
+
+async def sample_quiz_questions(connection, conditions, parameters, count,
+                                generator):
+    ''' the seeded sample of sample_quiz_questions '''
+    candidates = await fetch(connection, *quiz_sample_statement(
+        conditions, parameters, count, generator))
+    rows = generator.sample(candidates, min(count, len(candidates)))
+    if len(rows) < count:
+        missing = count - len(rows)
+        rows += top_up_rows(await fetch(connection, *quiz_top_up_statement(
+            conditions, parameters, [row['id'] for row in rows], missing,
+            generator.random())), missing)
+        generator.shuffle(rows)
+    return rows
+
+
+async def sample_difficulty_questions(connection, category_id,
+                                      previous_questions, difficulty, count,
+                                      generator):
+    ''' the sample of sample_difficulty_questions '''
+    if 'weights' not in difficulty:
+        conditions, parameters = available_conditions(
+            category_id, previous_questions)
+        return await sample_quiz_questions(
+            connection, conditions + range_conditions(difficulty),
+            dict(parameters, **difficulty), count, generator)
+    weights = distribution(difficulty)
+    rows = []
+    while len(rows) < count and weights:
+        keys = sorted(weights)
+        drawn = Counter(generator.choices(
+            keys, [weights[key] for key in keys], k=count - len(rows)))
+        chosen = list(previous_questions) + [row['id'] for row in rows]
+        for key in keys:
+            if not drawn[key]:
+                continue
+            conditions, parameters = available_conditions(
+                category_id, chosen)
+            picked = await sample_quiz_questions(
+                connection, conditions + ['difficulty = :difficulty'],
+                dict(parameters, difficulty=key), drawn[key], generator)
+            if len(picked) < drawn[key]:
+                del weights[key]
+            rows += picked
+    generator.shuffle(rows)
+    return rows
+
+
+def register_routes(app):
+    # whether the full text index exists is checked once
+    search_index = {}
+
+    async def not_implemented(request, connection, **arguments):
+        abort(501)
+
+    for method, pattern in flask_only_routes:
+        app.route(method, pattern)(not_implemented)
+
+    @app.route('GET', '/questions')
+    async def retrieve_questions(request, connection):
+        fields = requested_fields(request)
+        include = requested_names(request, 'include', listing_parts)
+        if not isValidInclude(include):
+            abort(400)
+        questions, next_cursor = await paginate_questions(
+            request, connection, fields)
+        if not questions:
+            abort(404)
+        body = {
+            'success': True,
+            'questions': questions,
+            'total_questions': await count_questions(connection),
+            'total_questions_exact': True,
+            'current_category': None,
+            'next_cursor': next_cursor
+        }
+        if 'categories' in include:
+            categories = await connection.fetch(
+                'SELECT id, type FROM categories ORDER BY id')
+            body['categories'] = [format_category(row) for row in categories]
+        return body, 200
+
+    @app.route('POST', '/questions')
+    async def add_or_search_questions(request, connection):
+        if 'idempotency-key' in request.headers:
+            abort(501)
+        data = request.json()
+        if 'searchTerm' in data.keys():
+            if data['searchTerm'] == '':
+                abort(400)
+            page = data.get('page', 1)
+            limit = data.get('limit', QUESTIONS_PER_PAGE)
+            if not isValidPage(page, limit):
+                abort(400)
+            if 'indexed' not in search_index:
+                search_index['indexed'] = await has_search_index(connection)
+            questions, total_questions = await search_questions(
+                connection, data['searchTerm'], page, limit,
+                search_index['indexed'])
+            return {
+                'success': True,
+                'questions': questions,
+                'total_questions': total_questions,
+                'current_category': None
+            }, 200
+        if not isValidQuestion(data):
+            abort(400)
+        category = await connection.fetchval(
+            'SELECT id FROM categories WHERE id = $1', int(data['category']))
+        if category is None:
+            abort(422)
+        content_hash = question_content_hash(data['question'], data['answer'])
+        while True:
+            row = await connection.fetchrow(
+                'INSERT INTO questions '
+                '(question, answer, category, difficulty, content_hash) '
+                'VALUES ($1, $2, $3, $4, $5) '
+                'ON CONFLICT (content_hash) DO NOTHING RETURNING '
+                + question_columns,
+                data['question'], data['answer'], category,
+                int(data['difficulty']), content_hash)
+            if row is not None:
+                return {'success': True, 'data': format_question(row)}, 201
+            # already stored, unless it has just been deleted
+            row = await connection.fetchrow(
+                'SELECT ' + question_columns + ' FROM questions '
+                'WHERE content_hash = $1', content_hash)
+            if row is not None and row['category'] != category:
+                abort(422)
+            if row is not None:
+                return {'success': True, 'data': format_question(row)}, 200
+
+    @app.route('DELETE', '/questions/<int:id>')
+    async def delete_question(request, connection, id):
+        deleted = await connection.fetchval(
+            'DELETE FROM questions WHERE id = $1 RETURNING id', id)
+        if deleted is None:
+            abort(422)
+        return {
+            'success': True,
+            'message': f'Question with ID: {id} deleted'
+        }, 200
+
+    @app.route('GET', '/categories')
+    async def retrieve_categories(request, connection):
+        categories = await connection.fetch(
+            'SELECT id, type FROM categories ORDER BY id')
+        if not categories:
+            abort(404)
+        return {
+            'success': True,
+            'categories': [format_category(row) for row in categories]
+        }, 200
+
+    @app.route('GET', '/categories/<int:id>/questions')
+    async def retrieve_questions_by_category(request, connection, id):
+        questions, next_cursor = await paginate_questions(
+            request, connection, requested_fields(request), category=id)
+        if not questions:
+            abort(404)
+        category = await connection.fetchrow(
+            'SELECT id, type FROM categories WHERE id = $1', id)
+        return {
+            'success': True,
+            'questions': questions,
+            'total_questions': await count_questions(connection, id),
+            'total_questions_exact': True,
+            'current_category': category and format_category(category),
+            'next_cursor': next_cursor
+        }, 200
+
+    @app.route('POST', '/quizzes')
+    async def get_quiz_question(request, connection):
+        data = request.json()
+        if not isValidQuizRequest(data):
+            abort(400)
+        difficulty = data.get('difficulty')
+        if difficulty is not None and not isValidDifficulty(difficulty):
+            abort(400)
+        category_id = data['quiz_category']['id']
+        if category_id != ALL_CATEGORIES:
+            category_id = int(category_id)
+        previous_questions = [int(id) for id in data['previous_questions']]
+        if 'count' in data or 'seed' in data:
+            count = data.get('count', 1)
+            seed = data.get('seed')
+            if seed is None:
+                seed = random.getrandbits(32)
+            if not isValidQuizBatch(count, seed):
+                abort(400)
+            if not 0 <= seed < QUIZ_SEED_LIMIT:
+                abort(422)
+            if difficulty is not None:
+                questions = await sample_difficulty_questions(
+                    connection, category_id, previous_questions,
+                    difficulty, count, random.Random(seed))
+            else:
+                questions = await sample_quiz_questions(
+                    connection, *available_conditions(
+                        category_id, previous_questions),
+                    count, random.Random(seed))
+            if not questions:
+                abort(404)
+            return {
+                'success': True,
+                'questions': [format_question(row) for row in questions],
+                'seed': seed
+            }, 200
+        if difficulty is not None:
+            questions = await sample_difficulty_questions(
+                connection, category_id, previous_questions, difficulty, 1,
+                random.Random())
+            if not questions:
+                abort(404)
+            return {
+                'success': True,
+                'question': format_question(questions[0])
+            }, 200
+        conditions, parameters = [], []
+        if category_id != ALL_CATEGORIES:
+            parameters.append(category_id)
+            conditions.append('category = ${}'.format(len(parameters)))
+        if previous_questions:
+            parameters.append(previous_questions)
+            conditions.append('id <> ALL(${})'.format(len(parameters)))
+        where = ' AND '.join(conditions) or 'true'
+        # the random pivot of select_quiz_question
+        low, high = await connection.fetchrow(
+            'SELECT min(id), max(id) FROM questions WHERE ' + where,
+            *parameters)
+        if low is None:
+            abort(404)
+        parameters.append(random.randint(low, high))
+        row = await connection.fetchrow(
+            'SELECT {} FROM questions WHERE {} AND id >= ${} '
+            'ORDER BY id LIMIT 1'.format(
+                question_columns, where, len(parameters)),
+            *parameters)
+        return {
+            'success': True,
+            'question': format_question(row)
+        }, 200
@@ -0,0 +1,34 @@
+'''
+redis_client(url)
+    connects to a Redis compatible server. The redis package
+    is only imported, and only needs to be installed, when a
+    feature is configured with a redis:// backend
+'''
+
+
+def redis_client(url):
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError(
+            'the redis package is required to use {}, '
+            'install it with `pip install redis`'.format(url))
+    return redis.Redis.from_url(url)
+
+
+'''
+create_asyncpg_pool(url, min_size, max_size)
+    opens a pool of asyncpg connections for the ASGI entry
+    point. asyncpg is only needed when that entry point runs
+'''
+
+
+async def create_asyncpg_pool(url, min_size, max_size):
+    try:
+        import asyncpg
+    except ImportError:
+        raise RuntimeError(
+            'the asyncpg package is required to serve the API with ASGI, '
+            'install it with `pip install asyncpg`')
+    return await asyncpg.create_pool(
+        url, min_size=min_size, max_size=max_size)
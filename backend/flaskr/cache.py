@@ -0,0 +1,436 @@
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from urllib.parse import urlencode
+from flask import current_app, make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .backends import redis_client
+from .models import Category, Question
+from .replicas import primary_reads, reads_primary
+
+category_cache_ttl = float(os.getenv('CATEGORY_CACHE_TTL', 300))
+# memory, a redis:// URL or off
+response_cache_backend = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+response_cache_ttl = int(os.getenv('RESPONSE_CACHE_TTL', 60))
+response_cache_max_entries = int(
+    os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+response_cache_max_bytes = int(
+    os.getenv('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+# how long clients may reuse a response without revalidating it
+response_cache_max_age = int(os.getenv('RESPONSE_CACHE_MAX_AGE', 0))
+
+'''
+CategoryCache
+    keeps the formatted categories in memory so that
+    the endpoints do not query the categories table
+    on every request
+'''
+
+
+class SharedGeneration:
+    ''' a counter in shared memory. The workers that a preloading
+        server forks from the process that created it share it,
+        a bump in one of them is seen by all the others
+    '''
+
+    def __init__(self):
+        self._value = multiprocessing.Value('q', 0)
+
+    @property
+    def value(self):
+        return self._value.value
+
+    def bump(self):
+        with self._value.get_lock():
+            self._value.value += 1
+
+
+class CategoryCache:
+
+    def __init__(self, ttl=category_cache_ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._generation = SharedGeneration()
+        self._loaded_generation = None
+        self._categories = None
+        self._by_id = {}
+        self._etag = None
+        self._expires_at = 0
+
+    def _fresh(self):
+        return (
+            self._categories is not None
+            and self._loaded_generation == self._generation.value
+            and time.monotonic() < self._expires_at)
+
+    def _load(self):
+        ''' returns the cached categories, loading them
+            from the database when they are missing or expired
+        '''
+        with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self._categories, self._by_id, self._etag
+            self.misses += 1
+            generation = self._generation.value
+        with primary_reads():
+            categories = [
+                category.format()
+                for category in Category.query.order_by(Category.id).all()
+            ]
+        by_id = {category['id']: category for category in categories}
+        etag = hashlib.sha1(
+            json.dumps(categories, sort_keys=True).encode()).hexdigest()
+        with self._lock:
+            # a write that happened while loading makes the
+            # result stale, serve it but do not keep it
+            if generation == self._generation.value:
+                self._loaded_generation = generation
+                self._categories = categories
+                self._by_id = by_id
+                self._etag = etag
+                self._expires_at = time.monotonic() + self.ttl
+        return categories, by_id, etag
+
+    def all(self):
+        ''' returns the list of formatted categories '''
+        return self._load()[0]
+
+    def get(self, id):
+        ''' returns the formatted category with the given id
+            or None if it does not exist
+        '''
+        return self._load()[1].get(id)
+
+    def all_with_etag(self):
+        ''' returns the list of formatted categories together
+            with an entity tag identifying its contents
+        '''
+        categories, _, etag = self._load()
+        return categories, etag
+
+    def invalidate(self):
+        self._generation.bump()
+        with self._lock:
+            self._categories = None
+            self._by_id = {}
+            self._etag = None
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'size': len(self._by_id),
+                'ttl': self.ttl
+            }
+
+
+category_cache = CategoryCache()
+
+
+'''
+Response stores
+    keep the bodies of the cached responses. Every entry
+    records the generation of the cache it was computed in,
+    a write bumps the generation so that all the entries
+    computed before it stop being served at once. The
+    generation of the memory store is shared by the workers
+    forked from the process that created it, so that a write
+    reaches the workers of a preloading gunicorn, the Redis
+    store also shares it across hosts.
+'''
+
+CachedResponse = namedtuple(
+    'CachedResponse',
+    ('body', 'status', 'mimetype', 'etag', 'created', 'generation'))
+
+
+class MemoryResponseStore:
+    ''' a least recently used cache bounded by the number of
+        entries and by the total size of their bodies
+    '''
+
+    def __init__(self, ttl=response_cache_ttl,
+                 max_entries=response_cache_max_entries,
+                 max_bytes=response_cache_max_bytes):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = SharedGeneration()
+        self._cleared_generation = 0
+
+    def get(self, key):
+        ''' returns the entry, or None, and the current generation '''
+        generation = self._generation.value
+        with self._lock:
+            if generation != self._cleared_generation:
+                # another worker wrote, drop what was computed before
+                self._clear()
+                self._cleared_generation = generation
+            item = self._entries.get(key)
+            if item is None:
+                return None, generation
+            entry, expires_at = item
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None, generation
+            self._entries.move_to_end(key)
+            return entry, generation
+
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key):
+        entry, _ = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def set(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (entry, time.monotonic() + self.ttl)
+            self._bytes += len(entry.body)
+            while (len(self._entries) > self.max_entries
+                    or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def bump(self):
+        self._generation.bump()
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'bytes': self._bytes}
+
+
+class RedisResponseStore:
+    ''' keeps the responses in Redis hashes and the generation
+        in a counter, so that the workers share the entries and
+        a write in one worker invalidates them for all of them
+    '''
+    key_prefix = 'trivia:response:'
+    generation_key = 'trivia:response-generation'
+
+    def __init__(self, url, ttl=response_cache_ttl):
+        self.redis = redis_client(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        pipeline = self.redis.pipeline()
+        pipeline.hgetall(self.key_prefix + key)
+        pipeline.get(self.generation_key)
+        fields, generation = pipeline.execute()
+        generation = int(generation or 0)
+        if not fields:
+            return None, generation
+        return CachedResponse(
+            body=fields[b'body'],
+            status=int(fields[b'status']),
+            mimetype=fields[b'mimetype'].decode(),
+            etag=fields[b'etag'].decode(),
+            created=int(fields[b'created']),
+            generation=int(fields[b'generation'])), generation
+
+    def set(self, key, entry):
+        pipeline = self.redis.pipeline()
+        pipeline.hset(self.key_prefix + key, mapping=entry._asdict())
+        pipeline.expire(self.key_prefix + key, self.ttl)
+        pipeline.execute()
+
+    def bump(self):
+        self.redis.incr(self.generation_key)
+
+    def stats(self):
+        return {'generation': int(self.redis.get(self.generation_key) or 0)}
+
+
+'''
+ResponseCache
+    serves GET endpoints from a response store, keyed on the
+    path and the sorted query string. Every response gets an
+    ETag, a Last-Modified date and Cache-Control headers, and
+    conditional requests are answered with 304.
+'''
+
+
+class ResponseCache:
+
+    def __init__(self, store, max_age=response_cache_max_age):
+        self.store = store
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def key(self):
+        return '{}?{}'.format(
+            request.path, urlencode(sorted(request.args.items(multi=True))))
+
+    def cached(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # a client that has just written reads the primary, it
+            # must not be served what a replica rendered before
+            store = None if reads_primary() else self.store
+            if store is not None:
+                key = self.key()
+                entry, generation = store.get(key)
+                if entry is not None and entry.generation == generation:
+                    self._count('hits')
+                    return self.respond(entry)
+                self._count('misses')
+                # what is stored is rendered from the primary
+                with primary_reads():
+                    response = make_response(view(*args, **kwargs))
+            else:
+                response = make_response(view(*args, **kwargs))
+            entry = self.entry(response, generation if store else 0)
+            if entry is None:
+                return response
+            if store is not None:
+                store.set(key, entry)
+            return self.respond(entry)
+        return wrapper
+
+    def entry(self, response, generation):
+        ''' the entry of a successful response, error responses
+            are neither cached nor given validators
+        '''
+        if response.status_code != 200 or response.is_streamed:
+            return None
+        body = response.get_data()
+        etag = response.get_etag()[0] or hashlib.sha1(body).hexdigest()
+        return CachedResponse(
+            body=body,
+            status=response.status_code,
+            mimetype=response.mimetype,
+            etag=etag,
+            created=int(time.time()),
+            generation=generation)
+
+    def respond(self, entry):
+        response = current_app.response_class(
+            entry.body, status=entry.status, mimetype=entry.mimetype)
+        response.set_etag(entry.etag)
+        response.last_modified = entry.created
+        if self.max_age:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def invalidate(self):
+        self._count('invalidations')
+        if self.store is not None:
+            self.store.bump()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'backend': type(self.store).__name__ if self.store else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'max_age': self.max_age
+            }
+        if self.store is not None:
+            stats.update(self.store.stats())
+        return stats
+
+
+def create_response_store(backend):
+    if backend == 'off':
+        return None
+    if backend == 'memory':
+        return MemoryResponseStore()
+    return RedisResponseStore(backend)
+
+
+response_cache = ResponseCache(create_response_store(response_cache_backend))
+
+
+'''
+invalidation hooks
+    any write to the categories table made through the ORM
+    empties the category cache, and writes to the questions
+    or categories tables invalidate the cached responses,
+    once the transaction commits, so that rows or a response
+    read before the commit are not cached as the new state.
+    A rolled back transaction invalidates nothing.
+    Writes that bypass the ORM call response_cache.invalidate
+    themselves.
+'''
+
+
+def mark_responses_stale(session):
+    if session is not None:
+        session.info['responses_stale'] = True
+
+
+def mark_categories_stale(session):
+    if session is not None:
+        session.info['categories_stale'] = True
+
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def invalidate_on_flush(mapper, connection, target):
+    mark_categories_stale(object_session(target))
+    mark_responses_stale(object_session(target))
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+@event.listens_for(Question, 'after_delete')
+def invalidate_responses_on_flush(mapper, connection, target):
+    mark_responses_stale(object_session(target))
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def invalidate_on_bulk_write(context):
+    if context.mapper.class_ is Category:
+        mark_categories_stale(context.session)
+    if context.mapper.class_ in (Category, Question):
+        mark_responses_stale(context.session)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_on_commit(session):
+    if session.info.pop('categories_stale', False):
+        category_cache.invalidate()
+    if session.info.pop('responses_stale', False):
+        response_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_stale_caches(session):
+    session.info.pop('categories_stale', None)
+    session.info.pop('responses_stale', None)
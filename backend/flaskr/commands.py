@@ -0,0 +1,59 @@
+import click
+
+from .migrations import upgrade
+from .questions.bulk import import_questions, read_records, import_formats
+from .questions.export import export_query, export_chunks, export_formats
+
+'''
+register_commands(app)
+    adds the maintenance commands to the `flask` command line
+'''
+
+
+def register_commands(app):
+
+    @app.cli.command('migrate')
+    def migrate():
+        ''' Create the tables and apply the pending schema migrations. '''
+        applied = upgrade()
+        if applied:
+            click.echo('applied migrations: {}'.format(
+                ', '.join(str(version) for version in applied)))
+        else:
+            click.echo('the schema is up to date')
+
+    @app.cli.command('import-questions')
+    @click.argument('source', type=click.File('rb'))
+    @click.option(
+        '--format', type=click.Choice(import_formats), default=None,
+        help='Defaults to csv for .csv files and ndjson otherwise.')
+    @click.option('--chunk-size', type=click.IntRange(min=1), default=None)
+    def import_questions_command(source, format, chunk_size):
+        ''' Import questions from a JSON Lines or CSV file, - for stdin. '''
+        if format is None:
+            format = 'csv' if source.name.endswith('.csv') else 'ndjson'
+        result = import_questions(read_records(source, format), chunk_size)
+        for error in result.errors:
+            click.echo('line {}: {}'.format(
+                error['line'], error['message']), err=True)
+        click.echo(
+            'imported {} questions, {} duplicates skipped, '
+            '{} rows rejected'.format(
+                sum(result.inserted.values()), result.duplicates,
+                result.total_errors))
+
+    @app.cli.command('export-questions')
+    @click.argument('target', type=click.File('w'), default='-')
+    @click.option(
+        '--format', type=click.Choice(export_formats), default=None,
+        help='Defaults to csv for .csv files and ndjson otherwise.')
+    @click.option('--category', type=int, default=None)
+    @click.option('--min-id', type=int, default=None)
+    @click.option('--max-id', type=int, default=None)
+    def export_questions_command(target, format, category, min_id, max_id):
+        ''' Export questions as JSON Lines or CSV, to stdout by default. '''
+        if format is None:
+            format = 'csv' if target.name.endswith('.csv') else 'ndjson'
+        rows = export_query(category=category, min_id=min_id, max_id=max_id)
+        for chunk in export_chunks(rows, format):
+            target.write(chunk)
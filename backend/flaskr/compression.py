@@ -0,0 +1,84 @@
+import gzip
+import io
+import os
+import time
+from flask import request
+
+from .instrumentation import current_timings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+response_compression = os.getenv(
+    'RESPONSE_COMPRESSION', 'true').lower() in ('1', 'true', 'yes')
+# smaller bodies are sent as they are, compressing them saves
+# less than the headers it adds
+compression_min_size = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+gzip_level = int(os.getenv('RESPONSE_COMPRESSION_GZIP_LEVEL', 6))
+brotli_quality = int(os.getenv('RESPONSE_COMPRESSION_BROTLI_QUALITY', 4))
+compressible_mimetypes = (
+    'application/json', 'application/x-ndjson', 'text/csv', 'text/plain')
+
+'''
+Response compression
+    compresses the bodies of the responses that are larger
+    than compression_min_size with brotli, when it is
+    installed and the client accepts it, or with gzip.
+    Streamed responses, such as the exports, are sent as they
+    are. The strong ETag of a compressed response becomes weak,
+    the conditional requests compare weakly and still match.
+'''
+
+
+def compression_encodings():
+    if brotli is not None:
+        return ('br', 'gzip')
+    return ('gzip',)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    # gzip.compress only takes an mtime from Python 3.8, a zero
+    # mtime gives the same bytes for the same body
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=gzip_level,
+                       mtime=0) as file:
+        file.write(body)
+    return buffer.getvalue()
+
+
+def init_compression(app):
+    ''' registers the hook that compresses the responses of the app,
+        after the instrumentation so that it is measured
+    '''
+    if not response_compression:
+        return
+
+    @app.after_request
+    def compress_response(response):
+        if (response.mimetype not in compressible_mimetypes
+                or response.is_streamed or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.status_code in (204, 206, 304)
+                or response.content_length is None
+                or response.content_length < compression_min_size):
+            return response
+        encoding = request.accept_encodings.best_match(
+            compression_encodings())
+        if encoding is None:
+            return response
+        start = time.perf_counter()
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        timings = current_timings()
+        if timings is not None:
+            timings.compression += time.perf_counter() - start
+        return response
@@ -0,0 +1,219 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from flask import abort, current_app, make_response, request
+
+from .backends import redis_client
+
+# memory, a redis:// URL or off
+idempotency_backend = os.getenv('IDEMPOTENCY_BACKEND', 'memory')
+# how long the result of a request answers its retries
+idempotency_ttl = int(os.getenv('IDEMPOTENCY_TTL', 24 * 60 * 60))
+idempotency_max_keys = int(os.getenv('IDEMPOTENCY_MAX_KEYS', 10000))
+idempotency_max_bytes = int(
+    os.getenv('IDEMPOTENCY_MAX_BYTES', 16 * 1024 * 1024))
+idempotency_key_max_length = 255
+
+'''
+Idempotency keys
+    a client that may retry a POST sends the same
+    Idempotency-Key header with every attempt. The first
+    attempt reserves the key and its response is stored, the
+    retries are answered with the stored response and an
+    Idempotent-Replayed header without running the view again.
+    A retry that arrives while the first attempt still runs
+    gets a 409, a key reused for a different body gets a 422.
+    Server errors release the key so that a retry runs again.
+'''
+
+StoredResult = namedtuple(
+    'StoredResult', ('fingerprint', 'status', 'mimetype', 'body'))
+
+
+class MemoryIdempotencyStore:
+    ''' a least recently used store of the results of this
+        process, bounded by the number of keys and by the
+        total size of the stored bodies
+    '''
+
+    def __init__(self, ttl=idempotency_ttl, max_keys=idempotency_max_keys,
+                 max_bytes=idempotency_max_bytes):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._bytes = 0
+
+    def _remove(self, key):
+        result, _ = self._results.pop(key)
+        self._bytes -= len(result.body)
+
+    def _put(self, key, result):
+        if key in self._results:
+            self._remove(key)
+        self._results[key] = (result, time.monotonic() + self.ttl)
+        self._bytes += len(result.body)
+        while (len(self._results) > self.max_keys
+                or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._results)))
+
+    def reserve(self, key, fingerprint):
+        ''' reserves the key for a request with the fingerprint and
+            returns None, or returns what is stored for the key, a
+            result without status while its request runs
+        '''
+        with self._lock:
+            item = self._results.get(key)
+            if item is not None and item[1] > time.monotonic():
+                self._results.move_to_end(key)
+                return item[0]
+            self._put(key, StoredResult(fingerprint, None, None, b''))
+        return None
+
+    def save(self, key, result):
+        if len(result.body) > self.max_bytes:
+            self.release(key)
+            return
+        with self._lock:
+            self._put(key, result)
+
+    def release(self, key):
+        with self._lock:
+            if key in self._results:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._results), 'bytes': self._bytes}
+
+
+class RedisIdempotencyStore:
+    ''' keeps the results in Redis hashes so that a retry that
+        reaches another worker is answered too, a script reserves
+        a key atomically
+    '''
+    key_prefix = 'trivia:idempotency:'
+    script = '''
+        if redis.call('HSETNX', KEYS[1], 'fingerprint', ARGV[1]) == 1 then
+            redis.call('EXPIRE', KEYS[1], ARGV[2])
+            return false
+        end
+        return redis.call('HGETALL', KEYS[1])
+    '''
+
+    def __init__(self, url, ttl=idempotency_ttl):
+        self.redis = redis_client(url)
+        self.ttl = ttl
+        self._reserve = self.redis.register_script(self.script)
+
+    def reserve(self, key, fingerprint):
+        fields = self._reserve(
+            keys=[self.key_prefix + key], args=[fingerprint, self.ttl])
+        if not fields:
+            return None
+        fields = dict(zip(fields[::2], fields[1::2]))
+        status = fields.get(b'status')
+        return StoredResult(
+            fingerprint=fields[b'fingerprint'].decode(),
+            status=int(status) if status is not None else None,
+            mimetype=fields.get(b'mimetype', b'').decode() or None,
+            body=fields.get(b'body', b''))
+
+    def save(self, key, result):
+        pipeline = self.redis.pipeline()
+        pipeline.hset(self.key_prefix + key, mapping=result._asdict())
+        pipeline.expire(self.key_prefix + key, self.ttl)
+        pipeline.execute()
+
+    def release(self, key):
+        self.redis.delete(self.key_prefix + key)
+
+    def stats(self):
+        return {}
+
+
+class IdempotentRequests:
+
+    def __init__(self, store):
+        self.store = store
+        self.stored = 0
+        self.replayed = 0
+        self.conflicts = 0
+        self.mismatches = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def idempotent(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if key is None or self.store is None:
+                return view(*args, **kwargs)
+            if not key or len(key) > idempotency_key_max_length:
+                abort(400)
+            key = '{} {} {}'.format(request.method, request.path, key)
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            stored = self.store.reserve(key, fingerprint)
+            if stored is not None:
+                if stored.fingerprint != fingerprint:
+                    self._count('mismatches')
+                    abort(422)
+                if stored.status is None:
+                    self._count('conflicts')
+                    abort(409)
+                self._count('replayed')
+                return self.respond(stored)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                self.store.release(key)
+                raise
+            if response.status_code >= 500 or response.is_streamed:
+                self.store.release(key)
+                return response
+            self.store.save(key, StoredResult(
+                fingerprint=fingerprint,
+                status=response.status_code,
+                mimetype=response.mimetype,
+                body=response.get_data()))
+            self._count('stored')
+            return response
+        return wrapper
+
+    def respond(self, result):
+        response = current_app.response_class(
+            result.body, status=result.status, mimetype=result.mimetype)
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'backend': type(self.store).__name__ if self.store else None,
+                'stored': self.stored,
+                'replayed': self.replayed,
+                'conflicts': self.conflicts,
+                'mismatches': self.mismatches
+            }
+        if self.store is not None:
+            stats.update(self.store.stats())
+        return stats
+
+
+def create_idempotency_store(backend):
+    if backend == 'off':
+        return None
+    if backend == 'memory':
+        return MemoryIdempotencyStore()
+    return RedisIdempotencyStore(backend)
+
+
+idempotent_requests = IdempotentRequests(
+    create_idempotency_store(idempotency_backend))
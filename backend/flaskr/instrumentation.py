@@ -0,0 +1,225 @@
+import os
+import threading
+import time
+from flask import g, has_app_context, request
+from flask.json import JSONEncoder
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+request_instrumentation = os.getenv(
+    'REQUEST_INSTRUMENTATION', 'true').lower() in ('1', 'true', 'yes')
+server_timing_header = os.getenv(
+    'SERVER_TIMING_HEADER', 'true').lower() in ('1', 'true', 'yes')
+
+'''
+Request instrumentation
+    counts the SQL statements of every request and measures
+    the time spent in the database, in JSON serialization, in
+    compression and in the whole request. The numbers of a
+    request are sent back in a Server-Timing header and added
+    to per endpoint totals that /internal/metrics renders for
+    Prometheus.
+    The cost is a few perf_counter calls per statement and a
+    lock per request, so it can stay enabled in production.
+'''
+
+
+class RequestTimings:
+    ''' the measurements of the request being served '''
+
+    __slots__ = (
+        'started', 'queries', 'database', 'serialization', 'compression')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.database = 0.0
+        self.serialization = 0.0
+        self.compression = 0.0
+
+
+def current_timings():
+    if not has_app_context():
+        return None
+    return g.get('request_timings')
+
+
+class EndpointMetrics:
+    ''' totals of the requests served by this process, by
+        endpoint, method and status code. Durations are in
+        seconds like Prometheus expects.
+    '''
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, endpoint, method, status, timings, duration):
+        key = (endpoint, method, str(status))
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if duration <= bound:
+                index = position
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'requests': 0,
+                    'duration': 0.0,
+                    'queries': 0,
+                    'database': 0.0,
+                    'serialization': 0.0,
+                    'buckets': [0] * (len(self.buckets) + 1)
+                }
+            series['requests'] += 1
+            series['duration'] += duration
+            series['queries'] += timings.queries
+            series['database'] += timings.database
+            series['serialization'] += timings.serialization
+            series['buckets'][index] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: dict(series, buckets=list(series['buckets']))
+                for key, series in self._series.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+
+endpoint_metrics = EndpointMetrics()
+
+
+def format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace(
+            '"', '\\"')) for name, value in labels)
+
+
+def render_metrics(snapshot, gauges=()):
+    ''' renders the endpoint totals, followed by `gauges` of
+        (name, help, labels, value) tuples, in the Prometheus
+        text exposition format
+    '''
+    counters = (
+        ('trivia_requests_total', 'Requests served.', 'requests'),
+        ('trivia_db_queries_total', 'SQL statements executed.', 'queries'),
+        ('trivia_db_seconds_total',
+         'Time spent executing SQL statements.', 'database'),
+        ('trivia_serialization_seconds_total',
+         'Time spent serializing JSON responses.', 'serialization'),
+    )
+    lines = []
+    series = sorted(snapshot.items())
+    for name, help, field in counters:
+        lines.append('# HELP {} {}'.format(name, help))
+        lines.append('# TYPE {} counter'.format(name))
+        for (endpoint, method, status), values in series:
+            labels = format_labels((
+                ('endpoint', endpoint), ('method', method),
+                ('status', status)))
+            lines.append('{}{{{}}} {}'.format(name, labels, values[field]))
+    name = 'trivia_request_duration_seconds'
+    lines.append('# HELP {} Request duration.'.format(name))
+    lines.append('# TYPE {} histogram'.format(name))
+    for (endpoint, method, status), values in series:
+        labels = (
+            ('endpoint', endpoint), ('method', method), ('status', status))
+        cumulative = 0
+        bounds = EndpointMetrics.buckets + ('+Inf',)
+        for bound, count in zip(bounds, values['buckets']):
+            cumulative += count
+            lines.append('{}_bucket{{{}}} {}'.format(
+                name, format_labels(labels + (('le', bound),)), cumulative))
+        lines.append('{}_sum{{{}}} {}'.format(
+            name, format_labels(labels), values['duration']))
+        lines.append('{}_count{{{}}} {}'.format(
+            name, format_labels(labels), values['requests']))
+    documented = set()
+    for name, help, labels, value in gauges:
+        if name not in documented:
+            documented.add(name)
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} gauge'.format(name))
+        if labels:
+            lines.append('{}{{{}}} {}'.format(
+                name, format_labels(labels), value))
+        else:
+            lines.append('{} {}'.format(name, value))
+    return '\n'.join(lines) + '\n'
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    # on the execution context, a statement that raises leaves
+    # nothing behind on the pooled connection
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    started = getattr(context, '_query_started', None)
+    timings = current_timings()
+    if started is not None and timings is not None:
+        timings.queries += 1
+        timings.database += time.perf_counter() - started
+
+
+class TimedJSONEncoder(JSONEncoder):
+    ''' adds the time spent encoding responses to the
+        timings of the request
+    '''
+
+    def encode(self, o):
+        start = time.perf_counter()
+        try:
+            return super().encode(o)
+        finally:
+            timings = current_timings()
+            if timings is not None:
+                timings.serialization += time.perf_counter() - start
+
+
+def server_timing(timings, duration):
+    return ', '.join((
+        'db;dur={:.3f};desc="{} queries"'.format(
+            timings.database * 1000, timings.queries),
+        'serialize;dur={:.3f}'.format(timings.serialization * 1000),
+        'compress;dur={:.3f}'.format(timings.compression * 1000),
+        'total;dur={:.3f}'.format(duration * 1000)
+    ))
+
+
+def init_instrumentation(app):
+    ''' registers the hooks that measure every request of the app '''
+    if not request_instrumentation:
+        return
+    if not event.contains(
+            Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    app.json_encoder = TimedJSONEncoder
+
+    @app.before_request
+    def start_timings():
+        g.request_timings = RequestTimings()
+
+    @app.after_request
+    def record_timings(response):
+        timings = g.pop('request_timings', None)
+        if timings is None:
+            return response
+        duration = time.perf_counter() - timings.started
+        endpoint_metrics.observe(
+            request.endpoint or 'unmatched', request.method,
+            response.status_code, timings, duration)
+        if server_timing_header:
+            response.headers['Server-Timing'] = server_timing(
+                timings, duration)
+        return response
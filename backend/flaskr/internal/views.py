@@ -0,0 +1,81 @@
+import os
+from flask import current_app, jsonify, Blueprint, Response
+
+from ..cache import category_cache, response_cache
+from ..idempotency import idempotent_requests
+from ..instrumentation import endpoint_metrics, render_metrics
+from ..limits import admission_control, rate_limiter
+from ..models import db
+from ..pool import pool_stats
+from ..questions.index import question_index
+from ..replicas import replica_set
+
+
+internal = Blueprint('internal', __name__)
+'''
+Endpoint to check the effect of the in-process
+category cache, of the response cache, of the
+question id index and of the stored results of
+the idempotent requests.
+'''
+@internal.route('/cache')
+def retrieve_cache_stats():
+    return jsonify({
+        'success': True,
+        'category_cache': category_cache.stats(),
+        'response_cache': response_cache.stats(),
+        'question_index': question_index.stats(),
+        'idempotency': idempotent_requests.stats()
+    }), 200
+
+
+'''
+Endpoint to check the connection pools of the worker
+that serves the request, and the state of the replicas.
+'''
+@internal.route('/pool')
+def retrieve_pool_stats():
+    replicas = replica_set.stats(current_app)
+    for key, stats in replicas['replicas'].items():
+        stats['pool'] = pool_stats(db.get_engine(bind=key))
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'pool': pool_stats(db.engine),
+        'replicas': replicas
+    }), 200
+
+
+'''
+Endpoint to check the rate limiting of the clients and the
+admission control of the worker that serves the request.
+'''
+@internal.route('/limits')
+def retrieve_limit_stats():
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'rate_limit': rate_limiter.stats(),
+        'admission': admission_control.stats()
+    }), 200
+
+
+'''
+Endpoint to scrape the request metrics of the worker
+that serves the request in the Prometheus text format.
+'''
+@internal.route('/metrics')
+def retrieve_metrics():
+    gauges = []
+    for name, value in category_cache.stats().items():
+        gauges.append((
+            'trivia_category_cache', 'State of the category cache.',
+            (('stat', name),), value))
+    for name, value in pool_stats(db.engine).items():
+        if isinstance(value, int):
+            gauges.append((
+                'trivia_db_pool', 'State of the connection pool.',
+                (('stat', name),), value))
+    return Response(
+        render_metrics(endpoint_metrics.snapshot(), gauges),
+        mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,253 @@
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from flask import abort, g, request
+
+from .backends import redis_client
+from .models import database_pool_size, database_max_overflow
+
+# memory, a redis:// URL or off
+rate_limit_backend = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+# the tokens of a client, spent by its requests and refilled
+# at rate_limit_rate tokens per second
+rate_limit_capacity = float(os.getenv('RATE_LIMIT_CAPACITY', 60))
+rate_limit_rate = float(os.getenv('RATE_LIMIT_RATE', 10))
+rate_limit_max_clients = int(os.getenv('RATE_LIMIT_MAX_CLIENTS', 100000))
+# the requests that use the database at the same time in a
+# worker, by default as many as its pool has connections,
+# zero to leave them unlimited
+admission_max_concurrent = int(os.getenv(
+    'ADMISSION_MAX_CONCURRENT', database_pool_size + database_max_overflow))
+# how long a request waits for a slot before it is shed
+admission_timeout = float(os.getenv('ADMISSION_TIMEOUT', 0.5))
+
+'''
+Rate limiting and admission control
+    every client, by remote address, has a bucket of tokens
+    that its API requests spend and that refills over time,
+    a request that finds too few tokens is answered with a
+    429 and the seconds to wait in Retry-After. The routes
+    that keep the database busy cost more tokens.
+    The requests that are let in then take one of a fixed
+    number of slots of the worker, sized to its connection
+    pool, so that they never queue on the pool. A request
+    that finds no slot within admission_timeout is answered
+    with a 503 instead of waiting for a connection.
+    The internal endpoints are neither limited nor shed.
+'''
+
+# the tokens of the routes of the question blueprint,
+# the other routes cost one token
+route_costs = {
+    'question.retrieve_categories': 1,
+    'question.retrieve_questions': 2,
+    'question.retrieve_questions_by_category': 2,
+    'question.get_quiz_session_question': 1,
+    'question.get_quiz_question': 3,
+    'question.add_or_search_questions': 5,
+    'question.start_quiz_session': 5,
+    'question.export_questions': 10,
+    'question.bulk_delete_questions': 10,
+    'question.bulk_update_questions': 10,
+    'question.bulk_import_questions': 20
+}
+
+
+class MemoryBucketStore:
+    ''' keeps the buckets of the clients of this process, up to
+        max_clients of them, forgetting the least recently seen
+    '''
+
+    def __init__(self, max_clients=rate_limit_max_clients):
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, client, cost, capacity, rate):
+        ''' spends `cost` tokens of the bucket of the client when
+            it has them, returns whether it had them and the
+            tokens left
+        '''
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def stats(self):
+        with self._lock:
+            return {'clients': len(self._buckets)}
+
+
+class RedisBucketStore:
+    ''' keeps the buckets in Redis hashes so that all the workers
+        share them, a script updates a bucket atomically with the
+        clock of the Redis server
+    '''
+    key_prefix = 'trivia:rate-limit:'
+    script = '''
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(
+            capacity, tokens + math.max(0, now - updated) * rate)
+        local allowed = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return {allowed, tostring(tokens)}
+    '''
+
+    def __init__(self, url):
+        self.redis = redis_client(url)
+        self._take = self.redis.register_script(self.script)
+
+    def take(self, client, cost, capacity, rate):
+        allowed, tokens = self._take(
+            keys=[self.key_prefix + client], args=[capacity, rate, cost])
+        return bool(allowed), float(tokens)
+
+    def stats(self):
+        return {}
+
+
+def create_bucket_store(backend):
+    if backend == 'off':
+        return None
+    if backend == 'memory':
+        return MemoryBucketStore()
+    return RedisBucketStore(backend)
+
+
+class RateLimiter:
+
+    def __init__(self, store, capacity=rate_limit_capacity,
+                 rate=rate_limit_rate, costs=route_costs):
+        self.store = store
+        self.capacity = capacity
+        self.rate = rate
+        self.costs = costs
+        self._lock = threading.Lock()
+        self.limited = Counter()
+
+    def cost(self, endpoint):
+        # a route that cost more than the capacity could never run
+        return min(self.costs.get(endpoint, 1), self.capacity)
+
+    def check(self, client, endpoint):
+        ''' spends the tokens of a request of the client to the
+            endpoint, returns None when it can run or the seconds
+            to wait until it can
+        '''
+        cost = self.cost(endpoint)
+        allowed, tokens = self.store.take(
+            client, cost, self.capacity, self.rate)
+        if allowed:
+            return None
+        with self._lock:
+            self.limited[endpoint] += 1
+        return max(1, math.ceil((cost - tokens) / self.rate))
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'backend': type(self.store).__name__ if self.store else None,
+                'capacity': self.capacity,
+                'rate': self.rate,
+                'limited': dict(self.limited)
+            }
+        if self.store is not None:
+            stats.update(self.store.stats())
+        return stats
+
+
+class AdmissionControl:
+    ''' lets up to `limit` requests of this process use the
+        database at the same time
+    '''
+
+    def __init__(self, limit=admission_max_concurrent,
+                 timeout=admission_timeout):
+        self.limit = limit
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def enter(self):
+        ''' takes a slot, waiting up to `timeout` seconds for one,
+            and returns whether it got it
+        '''
+        admitted = self._slots is None or self._slots.acquire(
+            timeout=self.timeout)
+        with self._lock:
+            if admitted:
+                self.in_flight += 1
+                self.admitted += 1
+            else:
+                self.shed += 1
+        return admitted
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'timeout': self.timeout,
+                'in_flight': self.in_flight,
+                'admitted': self.admitted,
+                'shed': self.shed
+            }
+
+
+rate_limiter = RateLimiter(create_bucket_store(rate_limit_backend))
+admission_control = AdmissionControl()
+
+
+def init_limits(app):
+    ''' registers the hooks that limit and admit the requests to
+        the API of the app
+    '''
+
+    @app.before_request
+    def limit_request():
+        if request.blueprint != 'question' or request.method == 'OPTIONS':
+            return
+        if rate_limiter.store is not None:
+            retry_after = rate_limiter.check(
+                request.remote_addr or 'unknown', request.endpoint)
+            if retry_after is not None:
+                g.retry_after = retry_after
+                abort(429)
+        if not admission_control.enter():
+            g.retry_after = 1
+            abort(503)
+        g.admitted = True
+
+    @app.teardown_request
+    def release_request(error=None):
+        if g.pop('admitted', False):
+            admission_control.leave()
@@ -0,0 +1,168 @@
+import csv
+import io
+from sqlalchemy import Column, Integer, String, Table, MetaData, inspect
+
+from .models import db, question_content_hash
+
+'''
+Schema migrations
+    are applied in order by `flask migrate` and recorded in
+    the schema_migrations table. Every migration is a function
+    that receives a connection and can branch on its dialect,
+    so that the same list runs against Postgres and SQLite.
+'''
+
+migrations = []
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String))
+
+
+def migration(version, description):
+    def register(function):
+        migrations.append((version, description, function))
+        return function
+    return register
+
+
+@migration(1, 'full text index for question search')
+def add_question_search_index(connection):
+    if connection.dialect.name != 'postgresql':
+        return
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_questions_question_fts "
+        "ON questions USING gin (to_tsvector('simple', question))")
+
+
+@migration(2, 'integer foreign key and index for questions.category')
+def add_question_category_foreign_key(connection):
+    if connection.dialect.name == 'postgresql':
+        column_type = connection.execute(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = 'questions' AND column_name = 'category'"
+        ).scalar()
+        if column_type != 'integer':
+            connection.execute(
+                "ALTER TABLE questions ALTER COLUMN category TYPE integer "
+                "USING NULLIF(category, '')::integer")
+        # questions of categories that no longer exist would
+        # break the constraint, detach them like ON DELETE does
+        connection.execute(
+            "UPDATE questions SET category = NULL "
+            "WHERE category NOT IN (SELECT id FROM categories)")
+        foreign_key = connection.execute(
+            "SELECT 1 FROM pg_constraint WHERE contype = 'f' "
+            "AND conrelid = 'questions'::regclass").scalar()
+        if not foreign_key:
+            connection.execute(
+                "ALTER TABLE questions ADD CONSTRAINT questions_category_fkey "
+                "FOREIGN KEY (category) REFERENCES categories (id) "
+                "ON UPDATE CASCADE ON DELETE SET NULL")
+    # SQLite cannot change the type of a column, its type
+    # affinity already compares text and integer categories
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS ix_questions_category_id '
+        'ON questions (category, id)')
+
+
+def copy_question_hashes(connection, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        (row['id'], row['content_hash']) for row in rows)
+    buffer.seek(0)
+    connection.connection.cursor().copy_expert(
+        'COPY question_hashes (id, content_hash) FROM STDIN WITH (FORMAT csv)',
+        buffer)
+
+
+@migration(3, 'content hash and unique index for questions')
+def add_question_content_hash(connection, chunk_size=10000):
+    columns = inspect(connection).get_columns('questions')
+    if 'content_hash' not in {column['name'] for column in columns}:
+        connection.execute(
+            'ALTER TABLE questions ADD COLUMN content_hash VARCHAR(32)')
+    # the hashes are computed in Python, like the ones of the
+    # new questions, and staged in a table to be joined back
+    connection.execute(
+        'CREATE TEMPORARY TABLE question_hashes '
+        '(id INTEGER PRIMARY KEY, content_hash VARCHAR(32))')
+    question_hashes = Table(
+        'question_hashes', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('content_hash', String(32)))
+    rows = connection.execution_options(stream_results=True).execute(
+        'SELECT id, question, answer FROM questions '
+        'WHERE content_hash IS NULL')
+    while True:
+        chunk = [
+            {
+                'id': row.id,
+                'content_hash': question_content_hash(
+                    row.question, row.answer)
+            }
+            for row in rows.fetchmany(chunk_size)
+        ]
+        if not chunk:
+            break
+        if connection.dialect.name == 'postgresql':
+            copy_question_hashes(connection, chunk)
+        else:
+            connection.execute(question_hashes.insert(), chunk)
+    # with the questions inserted with their hash since
+    connection.execute(
+        'INSERT INTO question_hashes (id, content_hash) '
+        'SELECT id, content_hash FROM questions '
+        'WHERE content_hash IS NOT NULL')
+    # the unique index keeps one question per content, the
+    # oldest one, the later copies are deleted
+    connection.execute(
+        'DELETE FROM questions WHERE id IN ('
+        'SELECT id FROM ('
+        'SELECT id, row_number() OVER ('
+        'PARTITION BY content_hash ORDER BY id) AS copy '
+        'FROM question_hashes) copies WHERE copy > 1)')
+    if connection.dialect.name == 'postgresql':
+        connection.execute(
+            'UPDATE questions SET content_hash = h.content_hash '
+            'FROM question_hashes h '
+            'WHERE questions.id = h.id AND questions.content_hash IS NULL')
+    else:
+        connection.execute(
+            'UPDATE questions SET content_hash = ('
+            'SELECT h.content_hash FROM question_hashes h '
+            'WHERE h.id = questions.id) WHERE content_hash IS NULL')
+    connection.execute('DROP TABLE question_hashes')
+    connection.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_questions_content_hash '
+        'ON questions (content_hash)')
+
+
+def applied_versions(connection):
+    schema_migrations.create(connection, checkfirst=True)
+    return {
+        row.version
+        for row in connection.execute(schema_migrations.select())
+    }
+
+
+def upgrade(engine=None):
+    ''' creates the missing tables and applies the pending
+        migrations, each one in its own transaction.
+        Returns the list of applied versions.
+    '''
+    engine = engine or db.engine
+    db.Model.metadata.create_all(engine)
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+    applied = []
+    for version, description, function in sorted(migrations):
+        if version in done:
+            continue
+        with engine.begin() as connection:
+            function(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, description=description))
+        applied.append(version)
+    return applied
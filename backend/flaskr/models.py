@@ -1,27 +1,97 @@
+import hashlib
 import os
-from sqlalchemy import Column, String, Integer
-from flask_sqlalchemy import SQLAlchemy
+import unicodedata
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, event
+
+from .pool import InstrumentedQueuePool
+from .replicas import RoutingSQLAlchemy, replica_bind_prefix
 
 database_name = os.getenv('DATABASE_NAME')
 database_user = os.getenv('DATABASE_USER')
 database_password = os.getenv('DATABASE_PASSWORD')
+database_host = os.getenv('DATABASE_HOST', 'localhost:5432')
 database_path = "postgresql://{}:{}@{}/{}".format(
-    database_user, database_password, 'localhost:5432', database_name)
+    database_user, database_password, database_host, database_name)
+# comma separated URIs of read replicas of the database
+database_replica_urls = [
+    url.strip()
+    for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',')
+    if url.strip()
+]
+# connection pool sizing, the defaults are the ones of SQLAlchemy.
+# Every worker process has its own pool, so the database must accept
+# workers * (pool size + max overflow) connections
+database_pool_size = int(os.getenv('DATABASE_POOL_SIZE', 5))
+database_max_overflow = int(os.getenv('DATABASE_MAX_OVERFLOW', 10))
+database_pool_timeout = float(os.getenv('DATABASE_POOL_TIMEOUT', 30))
+database_pool_recycle = int(os.getenv('DATABASE_POOL_RECYCLE', -1))
+database_pool_pre_ping = os.getenv(
+    'DATABASE_POOL_PRE_PING', 'false').lower() in ('1', 'true', 'yes')
+# whether every application creates the missing tables when it starts,
+# set it to false in production and run `flask migrate` on deploy
+database_create_schema = os.getenv(
+    'DATABASE_CREATE_SCHEMA', 'true').lower() in ('1', 'true', 'yes')
+
+db = RoutingSQLAlchemy()
+
+'''
+engine_options(database_path)
+    returns the pool configuration for the database, SQLite
+    keeps the pool that SQLAlchemy picks for it
+'''
+
+
+def engine_options(database_path):
+    if database_path.startswith('sqlite'):
+        return {}
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': database_pool_size,
+        'max_overflow': database_max_overflow,
+        'pool_timeout': database_pool_timeout,
+        'pool_recycle': database_pool_recycle,
+        'pool_pre_ping': database_pool_pre_ping
+    }
 
-db = SQLAlchemy()
 
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service to the
+    database and its read replicas, without create_schema it
+    does not connect to the database
 '''
 
 
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path,
+             create_schema=database_create_schema,
+             replica_urls=database_replica_urls):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+    app.config["SQLALCHEMY_BINDS"] = {
+        '{}{}'.format(replica_bind_prefix, number): url
+        for number, url in enumerate(replica_urls)
+    }
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
-    db.create_all()
+    if create_schema:
+        db.create_all()
+
+
+'''
+question_content_hash(question, answer)
+    the hash that identifies the content of a question. The text
+    is compared after Unicode normalization, case folding and
+    whitespace collapsing, so that "Where is  china? " and
+    "where is China?" are the same question.
+'''
+
+
+def question_content_hash(question, answer):
+    text = '\x1f'.join(
+        ' '.join(unicodedata.normalize('NFKC', str(value)).casefold().split())
+        for value in (question, answer))
+    return hashlib.md5(text.encode()).hexdigest()
 
 
 '''
@@ -33,12 +103,22 @@ Question
 class Question(db.Model):
     __tablename__ = 'questions'
     __mapper_args__ = {'confirm_deleted_rows': False}
+    __table_args__ = (
+        # serves the category listing, the quiz selection
+        # and the per category counts
+        Index('ix_questions_category_id', 'category', 'id'),
+        # a question and its answer are stored once, the inserts
+        # skip the rows that conflict with it
+        Index('ix_questions_content_hash', 'content_hash', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey(
+        'categories.id', onupdate='CASCADE', ondelete='SET NULL'))
     difficulty = Column(Integer)
+    content_hash = Column(String(32))
 
     def __init__(self, question, answer, category, difficulty):
         self.question = question
@@ -67,6 +147,12 @@ class Question(db.Model):
         }
 
 
+@event.listens_for(Question, 'before_insert')
+@event.listens_for(Question, 'before_update')
+def hash_question_content(mapper, connection, target):
+    target.content_hash = question_content_hash(target.question, target.answer)
+
+
 '''
 Category
 
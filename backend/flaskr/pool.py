@@ -0,0 +1,111 @@
+import bisect
+import os
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import DisconnectionError, TimeoutError
+from sqlalchemy.pool import QueuePool
+
+'''
+CheckoutHistogram
+    records how long requests wait for a database connection,
+    in cumulative buckets of milliseconds like a Prometheus
+    histogram
+'''
+
+
+class CheckoutHistogram:
+    buckets = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.timeouts = 0
+
+    def observe(self, milliseconds):
+        index = bisect.bisect_left(self.buckets, milliseconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum += milliseconds
+
+    def timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            return {
+                'buckets': buckets,
+                'count': self.total,
+                'sum': self.sum,
+                'timeouts': self.timeouts
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    ''' a QueuePool that measures the time spent waiting
+        for a connection on every checkout
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_histogram = CheckoutHistogram()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            self.checkout_histogram.timeout()
+            raise
+        finally:
+            self.checkout_histogram.observe(
+                (time.perf_counter() - start) * 1000)
+
+
+'''
+Fork safety
+    a server that loads the application before forking its
+    workers, like gunicorn --preload, copies the connections
+    opened by the parent into every worker. A connection is
+    only handed out in the process that opened it, the copies
+    are dropped without being closed, since closing them would
+    also close the socket that the parent still holds.
+'''
+
+
+@event.listens_for(InstrumentedQueuePool, 'connect')
+def remember_process(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+
+@event.listens_for(InstrumentedQueuePool, 'checkout')
+def check_process(dbapi_connection, connection_record, connection_proxy):
+    pid = os.getpid()
+    if connection_record.info['pid'] != pid:
+        connection_record.connection = connection_proxy.connection = None
+        raise DisconnectionError(
+            'connection opened by process {}, checked out by {}'.format(
+                connection_record.info['pid'], pid))
+
+
+def pool_stats(engine):
+    ''' returns the state of the connection pool of an engine '''
+    pool = engine.pool
+    stats = {'class': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, name):
+            stats[name] = getattr(pool, name)()
+    if hasattr(pool, '_max_overflow'):
+        stats['max_overflow'] = pool._max_overflow
+    if hasattr(pool, 'checkout_histogram'):
+        stats['checkout_wait_ms'] = pool.checkout_histogram.snapshot()
+    return stats
@@ -0,0 +1,27 @@
+class AliasTable:
+    ''' draws the index of a weight with a probability proportional
+        to it, in constant time, with Vose's alias method. Building
+        the table takes a time linear in the number of weights.
+    '''
+
+    def __init__(self, weights):
+        size = len(weights)
+        total = float(sum(weights))
+        scaled = [weight * size / total for weight in weights]
+        self.probability = [1.0] * size
+        self.alias = list(range(size))
+        small = [number for number, value in enumerate(scaled) if value < 1]
+        large = [number for number, value in enumerate(scaled) if value >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+        # what is left is 1 up to rounding errors
+
+    def pick(self, generator):
+        number = generator.randrange(len(self.probability))
+        if generator.random() < self.probability[number]:
+            return number
+        return self.alias[number]
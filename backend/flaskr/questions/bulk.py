@@ -0,0 +1,333 @@
+import csv
+import io
+import itertools
+import json
+import os
+from collections import Counter
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import DBAPIError
+
+from ..cache import response_cache
+from ..models import db, Question, Category, question_content_hash
+from .counts import record_insert, record_delete, tracks_writes
+from .helpers import hasQuestionFields
+from .index import question_index
+
+
+import_chunk_size = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+# only the first errors are reported, a broken file
+# should not produce a response as large as itself
+max_reported_errors = 1000
+import_formats = ('ndjson', 'csv')
+question_fields = ('question', 'answer', 'category', 'difficulty')
+row_fields = question_fields + ('content_hash',)
+# the ids of a bulk delete or update, a larger selection
+# should use the filters instead
+bulk_max_ids = int(os.getenv('BULK_MAX_IDS', 10000))
+selection_keys = ('ids', 'category', 'difficulty', 'min_id', 'max_id')
+
+
+def read_records(stream, format):
+    ''' reads questions from a binary stream of JSON Lines or
+        CSV with a header row, one at a time.
+        Yields (line number, record, error) tuples where the
+        record is None when the line could not be parsed.
+    '''
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if format == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, 'invalid JSON'
+            continue
+        if not isinstance(record, dict):
+            yield number, None, 'expected a JSON object'
+            continue
+        yield number, record, None
+
+
+def validate_record(record, category_ids):
+    ''' returns the row to insert for a record, or
+        the reason why it cannot be inserted
+    '''
+    # the fields of CSV records are strings
+    if not hasQuestionFields(record):
+        return None, 'question, answer, category and difficulty are required'
+    try:
+        row = {
+            'question': str(record['question']),
+            'answer': str(record['answer']),
+            'category': int(record['category']),
+            'difficulty': int(record['difficulty'])
+        }
+    except (TypeError, ValueError):
+        return None, 'category and difficulty must be integers'
+    if row['category'] not in category_ids:
+        return None, 'category {} does not exist'.format(row['category'])
+    row['content_hash'] = question_content_hash(row['question'], row['answer'])
+    return row, None
+
+
+def insert_new_questions():
+    ''' an INSERT into questions that skips the rows whose content
+        is already stored, or comes earlier in the same statement
+    '''
+    table = Question.__table__
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing(
+            index_elements=[table.c.content_hash])
+    return table.insert().prefix_with('OR IGNORE')
+
+
+def insert_question(row):
+    ''' inserts a question unless one with the same content is
+        already stored, in a single statement. Returns the id of
+        the stored question and whether it was inserted.
+    '''
+    statement = insert_new_questions().values(**row)
+    while True:
+        if db.engine.dialect.name == 'postgresql':
+            id = db.session.execute(
+                statement.returning(Question.id)).scalar()
+        else:
+            result = db.session.execute(statement)
+            id = result.lastrowid if result.rowcount else None
+        if id is not None:
+            return id, True
+        id = db.session.query(Question.id).filter(
+            Question.content_hash == row['content_hash']).scalar()
+        # unless the stored question has just been deleted
+        if id is not None:
+            return id, False
+
+
+def copy_rows(rows):
+    ''' loads rows with COPY, the fastest way into Postgres. COPY
+        cannot skip conflicting rows, the rows are copied into a
+        temporary table and moved with a single INSERT ... SELECT
+        ... ON CONFLICT DO NOTHING. Returns the number of inserted
+        rows by category.
+    '''
+    db.session.execute(
+        'CREATE TEMPORARY TABLE IF NOT EXISTS question_import ('
+        'question text, answer text, category integer, '
+        'difficulty integer, content_hash varchar(32)'
+        ') ON COMMIT DELETE ROWS')
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[field] for field in row_fields])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        'COPY question_import ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            ', '.join(row_fields)),
+        buffer)
+    table = Question.__table__
+    staged = db.table(
+        'question_import', *(db.column(field) for field in row_fields))
+    inserted = db.session.execute(insert_new_questions().from_select(
+        row_fields, db.select([staged.c[field] for field in row_fields])
+    ).returning(table.c.category))
+    categories = Counter(category for category, in inserted)
+    db.session.execute('TRUNCATE question_import')
+    return categories
+
+
+def insert_rows(rows):
+    ''' inserts the rows that are not stored yet and returns the
+        number of inserted rows by category
+    '''
+    if db.engine.dialect.name == 'postgresql':
+        return copy_rows(rows)
+    statement = insert_new_questions()
+    return Counter(
+        row['category'] for row in rows
+        if db.session.execute(statement, row).rowcount)
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.inserted = Counter()
+        self.duplicates = 0
+        self.total_errors = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.total_errors += 1
+        if len(self.errors) < max_reported_errors:
+            self.errors.append({'line': line, 'message': message})
+
+    def format(self):
+        return {
+            'inserted': sum(self.inserted.values()),
+            'duplicates': self.duplicates,
+            'total_errors': self.total_errors,
+            'errors': self.errors
+        }
+
+
+def import_chunk(chunk, category_ids, result):
+    ''' validates and inserts a chunk of records inside a savepoint.
+        If the database rejects the chunk it is retried one row
+        at a time so that only the failing rows are reported.
+    '''
+    rows = []
+    for line, record, error in chunk:
+        if error is None:
+            row, error = validate_record(record, category_ids)
+        if error is not None:
+            result.error(line, error)
+        else:
+            rows.append((line, row))
+    if not rows:
+        return
+    # COPY runs on the raw DBAPI cursor, its errors are not wrapped
+    database_errors = (DBAPIError, db.engine.dialect.dbapi.Error)
+    try:
+        with db.session.begin_nested():
+            inserted = insert_rows([row for _, row in rows])
+    except database_errors:
+        for line, row in rows:
+            try:
+                with db.session.begin_nested():
+                    inserted = insert_rows([row])
+            except database_errors as error:
+                error = getattr(error, 'orig', error)
+                result.error(line, str(error).splitlines()[0])
+            else:
+                result.inserted.update(inserted)
+                result.duplicates += 1 - sum(inserted.values())
+        return
+    result.inserted.update(inserted)
+    result.duplicates += len(rows) - sum(inserted.values())
+
+
+def import_questions(records, chunk_size=None):
+    ''' imports the records in chunks inside a single transaction.
+        Invalid records are reported and skipped, they do not
+        abort the import, and the questions that are already
+        stored are counted as duplicates.
+    '''
+    chunk_size = chunk_size or import_chunk_size
+    category_ids = {id for id, in db.session.query(Category.id)}
+    result = ImportResult()
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+        import_chunk(chunk, category_ids, result)
+    db.session.commit()
+    # the rows are inserted without the ORM, which does not
+    # see them, the caches are updated here
+    for category, amount in result.inserted.items():
+        record_insert(category, amount)
+    if result.inserted:
+        response_cache.invalidate()
+        question_index.invalidate()
+    return result
+
+
+def read_selection(data):
+    ''' the ids and filters of a bulk delete or update request '''
+    return {key: data[key] for key in selection_keys if key in data}
+
+
+def selection_criteria(selection):
+    ''' the WHERE clause of the selected questions, a question
+        must match the ids and every filter
+    '''
+    criteria = []
+    if 'ids' in selection:
+        if db.engine.dialect.name == 'postgresql':
+            # id = ANY(:ids) sends one array whatever the number of ids
+            criteria.append(Question.id == db.any_(
+                db.literal(selection['ids'], type_=db.ARRAY(db.Integer))))
+        else:
+            criteria.append(Question.id.in_(selection['ids']))
+    if 'category' in selection:
+        criteria.append(Question.category == selection['category'])
+    if 'difficulty' in selection:
+        criteria.append(Question.difficulty == selection['difficulty'])
+    if 'min_id' in selection:
+        criteria.append(Question.id >= selection['min_id'])
+    if 'max_id' in selection:
+        criteria.append(Question.id <= selection['max_id'])
+    return db.and_(*criteria)
+
+
+def count_by_category(criteria):
+    return dict(db.session.query(
+        Question.category, db.func.count(Question.id)
+    ).filter(criteria).group_by(Question.category))
+
+
+def delete_questions(selection):
+    ''' deletes the selected questions with a single DELETE
+        statement and returns how many were deleted.
+        When the count provider keeps counters, the deleted
+        rows are first counted by category in the same
+        transaction.
+    '''
+    criteria = selection_criteria(selection)
+    deleted_by_category = count_by_category(
+        criteria) if tracks_writes() else {}
+    deleted = Question.query.filter(criteria).delete(
+        synchronize_session=False)
+    db.session.commit()
+    for category, amount in deleted_by_category.items():
+        record_delete(category, amount)
+    return deleted
+
+
+def content_hashes(criteria, changes):
+    ''' the content hashes of the selected questions once their
+        text is changed
+    '''
+    return [
+        {
+            'row_id': id,
+            'content_hash': question_content_hash(
+                changes.get('question', question),
+                changes.get('answer', answer))
+        }
+        for id, question, answer in db.session.query(
+            Question.id, Question.question, Question.answer
+        ).filter(criteria)
+    ]
+
+
+def update_questions(selection, changes):
+    ''' applies the changes to the selected questions with a
+        single UPDATE statement and returns how many were
+        updated. A change of the text also updates the content
+        hashes, by id. Raises IntegrityError for an unknown
+        category or when questions would have the same content.
+    '''
+    criteria = selection_criteria(selection)
+    moved_by_category = count_by_category(criteria) if (
+        'category' in changes and tracks_writes()) else {}
+    hashes = content_hashes(criteria, changes) if (
+        'question' in changes or 'answer' in changes) else []
+    updated = Question.query.filter(criteria).update(
+        changes, synchronize_session=False)
+    if hashes:
+        table = Question.__table__
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('row_id')).values(
+                content_hash=db.bindparam('content_hash')),
+            hashes)
+    db.session.commit()
+    for category, amount in moved_by_category.items():
+        record_delete(category, amount)
+        record_insert(changes['category'], amount)
+    return updated
@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+
+from ..models import db, Question
+from ..replicas import primary_reads
+from .index import question_index
+
+
+question_count_strategy = os.getenv('QUESTION_COUNT_STRATEGY', 'exact')
+question_count_resync = float(os.getenv('QUESTION_COUNT_RESYNC', 60))
+
+'''
+Count providers
+    answer the total_questions of the listing endpoints,
+    either exactly or from cheaper sources. count() returns
+    the number of questions in the category, or in the whole
+    table when the category is None, and whether that number
+    is exact.
+'''
+
+
+class ExactCount:
+    ''' runs a COUNT(*) for every call '''
+
+    # whether record_insert and record_delete do anything
+    tracks_writes = False
+
+    def count(self, category=None):
+        query = db.session.query(db.func.count(Question.id))
+        if category is not None:
+            query = query.filter(Question.category == category)
+        return query.scalar(), True
+
+    def record_insert(self, category, amount=1):
+        pass
+
+    def record_delete(self, category, amount=1):
+        pass
+
+
+class CounterCount:
+    ''' keeps per category counters in memory. They are loaded
+        with a single GROUP BY query, updated by the write paths
+        of this process and reloaded every `resync` seconds to
+        pick up the writes of other processes.
+    '''
+
+    tracks_writes = True
+
+    def __init__(self, resync=question_count_resync):
+        self.resync = resync
+        self._lock = threading.Lock()
+        self._counts = None
+        self._loaded_at = 0
+
+    def _load(self):
+        with primary_reads():
+            rows = db.session.query(
+                Question.category, db.func.count(Question.id)
+            ).group_by(Question.category).all()
+        return dict(rows)
+
+    def count(self, category=None):
+        with self._lock:
+            counts = self._counts
+            expired = time.monotonic() - self._loaded_at > self.resync
+        if counts is None or expired:
+            counts = self._load()
+            with self._lock:
+                self._counts = counts
+                self._loaded_at = time.monotonic()
+        if category is None:
+            return sum(counts.values()), False
+        return counts.get(int(category), 0), False
+
+    def _add(self, category, amount):
+        if category is None:
+            return
+        with self._lock:
+            if self._counts is not None:
+                key = int(category)
+                self._counts[key] = max(0, self._counts.get(key, 0) + amount)
+
+    def record_insert(self, category, amount=1):
+        self._add(category, amount)
+
+    def record_delete(self, category, amount=1):
+        self._add(category, -amount)
+
+
+class EstimateCount(ExactCount):
+    ''' reads the row estimate that Postgres keeps in
+        pg_class.reltuples, split by category with the
+        frequencies in pg_stats. Falls back to an exact
+        count on other databases and before the table
+        has been analyzed.
+    '''
+
+    def _estimate(self, category):
+        reltuples = db.session.execute(
+            "SELECT reltuples FROM pg_class "
+            "WHERE oid = to_regclass(:table)",
+            {'table': Question.__tablename__}).scalar()
+        if reltuples is None or reltuples <= 0:
+            return None
+        if category is None:
+            return int(reltuples)
+        stats = db.session.execute(
+            "SELECT most_common_vals::text::text[], most_common_freqs "
+            "FROM pg_stats WHERE tablename = :table AND attname = 'category'",
+            {'table': Question.__tablename__}).first()
+        if stats is None or stats[0] is None:
+            return None
+        frequencies = dict(zip(stats[0], stats[1]))
+        if str(category) not in frequencies:
+            return None
+        return int(round(reltuples * frequencies[str(category)]))
+
+    def count(self, category=None):
+        if db.engine.dialect.name == 'postgresql':
+            estimate = self._estimate(category)
+            if estimate is not None:
+                return estimate, False
+        return super().count(category)
+
+
+class IndexCount(ExactCount):
+    ''' counts the ids of the question id index, which keeps
+        itself up to date, loading it when it is not
+    '''
+
+    def count(self, category=None):
+        return question_index.count(category), False
+
+
+count_strategies = {
+    'exact': ExactCount,
+    'counter': CounterCount,
+    'estimate': EstimateCount,
+    'index': IndexCount
+}
+
+count_provider = count_strategies[question_count_strategy]()
+
+
+def use_count_strategy(name):
+    ''' switches the provider used by count_questions '''
+    global count_provider
+    count_provider = count_strategies[name]()
+    return count_provider
+
+
+def count_questions(category=None):
+    return count_provider.count(category)
+
+
+def tracks_writes():
+    ''' whether the write paths need to tell record_insert and
+        record_delete the categories of the rows they change
+    '''
+    return count_provider.tracks_writes
+
+
+def record_insert(category, amount=1):
+    count_provider.record_insert(category, amount)
+
+
+def record_delete(category, amount=1):
+    count_provider.record_delete(category, amount)
@@ -0,0 +1,166 @@
+import random
+from collections import Counter
+
+from ..models import Question
+from .index import question_index
+from .quiz import (
+    available_conditions, index_category, rows_in_order,
+    sample_quiz_questions)
+
+'''
+Difficulty quizzes
+    a quiz request can ask for a range of difficulties, where
+    every question in the range is as likely to be picked, or
+    for a distribution, the share of the questions of every
+    difficulty. The questions are drawn from the buckets of the
+    question id index with an alias table, so that a pick does
+    not depend on the size of the question bank.
+'''
+
+
+def range_weights(low, high):
+    ''' the questions with a difficulty from low to high, all
+        equally likely
+    '''
+    def weigh(keys, available):
+        return [
+            left if difficulty is not None and low <= difficulty <= high
+            else 0
+            for (_, difficulty), left in zip(keys, available)
+        ]
+    return weigh
+
+
+def distribution_weights(distribution):
+    ''' the questions of every difficulty in the proportion of
+        its weight, and equally likely within a difficulty. The
+        difficulties that have no question left are left out.
+    '''
+    def weigh(keys, available):
+        totals = Counter()
+        for (_, difficulty), left in zip(keys, available):
+            totals[difficulty] += left
+        return [
+            distribution.get(difficulty, 0) * left / totals[difficulty]
+            if left else 0
+            for (_, difficulty), left in zip(keys, available)
+        ]
+    return weigh
+
+
+def difficulty_weights(difficulty):
+    ''' the weights of a validated difficulty of a quiz request,
+        either {"min": 1, "max": 3} or {"weights": {"1": 0.5, ...}}
+    '''
+    if 'weights' in difficulty:
+        return distribution_weights(distribution(difficulty))
+    return range_weights(
+        difficulty.get('min', float('-inf')),
+        difficulty.get('max', float('inf')))
+
+
+def range_conditions(difficulty):
+    ''' the SQL conditions of a range of difficulties, on the
+        parameters min and max
+    '''
+    conditions = []
+    if 'min' in difficulty:
+        conditions.append('difficulty >= :min')
+    if 'max' in difficulty:
+        conditions.append('difficulty <= :max')
+    return conditions
+
+
+def distribution(difficulty):
+    ''' the positive weights of a distribution by difficulty '''
+    return {
+        int(key): weight
+        for key, weight in difficulty['weights'].items() if weight > 0
+    }
+
+
+def sample_difficulty_questions(category_id, previous_questions,
+                                difficulty, count, generator):
+    ''' picks up to `count` distinct questions with the difficulty
+        asked for from the database, for quizzes without the
+        question id index. A range is sampled whole, a
+        distribution draws the difficulty of every question with
+        the weights, then samples the questions of every
+        difficulty. The questions a difficulty falls short of
+        are drawn again among the others.
+    '''
+    if 'weights' not in difficulty:
+        conditions, parameters = available_conditions(
+            category_id, previous_questions)
+        return sample_quiz_questions(
+            conditions + range_conditions(difficulty),
+            dict(parameters, **difficulty), count, generator)
+    weights = distribution(difficulty)
+    rows = []
+    while len(rows) < count and weights:
+        keys = sorted(weights)
+        drawn = Counter(generator.choices(
+            keys, [weights[key] for key in keys], k=count - len(rows)))
+        chosen = list(previous_questions) + [row.id for row in rows]
+        for key in keys:
+            if not drawn[key]:
+                continue
+            conditions, parameters = available_conditions(
+                category_id, chosen)
+            picked = sample_quiz_questions(
+                conditions + ['difficulty = :difficulty'],
+                dict(parameters, difficulty=key), drawn[key], generator)
+            if len(picked) < drawn[key]:
+                del weights[key]
+            rows += picked
+    generator.shuffle(rows)
+    return rows
+
+
+def select_difficulty_question(category_id, previous_questions, difficulty):
+    ''' picks a question for the quiz with the difficulty asked for,
+        or returns None when there is none left
+    '''
+    previous_questions = list(previous_questions)
+    weigh = difficulty_weights(difficulty)
+    if not question_index.enabled:
+        rows = sample_difficulty_questions(
+            category_id, previous_questions, difficulty, 1, random.Random())
+        return Question.query.get(rows[0].id) if rows else None
+    while True:
+        ids = question_index.sample_weighted(
+            index_category(category_id), previous_questions, 1, weigh)
+        if not ids:
+            return None
+        question = Question.query.get(ids[0])
+        if question is not None:
+            return question
+        # deleted by another process since the index was loaded
+        previous_questions.append(ids[0])
+
+
+def select_difficulty_questions(category_id, previous_questions, difficulty,
+                                count, seed):
+    ''' picks up to `count` distinct questions with the difficulty
+        asked for, the same ones for the same seed as long as the
+        questions do not change, and returns their columns. The
+        ids of the index that are gone are replaced with new picks.
+    '''
+    generator = random.Random(seed)
+    if not question_index.enabled:
+        return sample_difficulty_questions(
+            category_id, previous_questions, difficulty, count, generator)
+    weigh = difficulty_weights(difficulty)
+    excluded = list(previous_questions)
+    rows = []
+    while len(rows) < count:
+        ids = question_index.sample_weighted(
+            index_category(category_id), excluded, count - len(rows),
+            weigh, generator)
+        if not ids:
+            break
+        rows += rows_in_order(ids)
+        # the ids deleted by another process since the index was
+        # loaded are left out of the next picks
+        excluded += ids
+    return rows
@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+
+from ..models import Question
+from ..serializers import question_rows, question_fields
+
+
+export_formats = ('ndjson', 'csv')
+export_mimetypes = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+export_batch_size = 1000
+
+
+def export_query(category=None, min_id=None, max_id=None):
+    ''' selects the question columns, without building ORM
+        objects, through a server side cursor that fetches
+        `export_batch_size` rows at a time
+    '''
+    query = question_rows()
+    if category is not None:
+        query = query.filter(Question.category == category)
+    if min_id is not None:
+        query = query.filter(Question.id >= min_id)
+    if max_id is not None:
+        query = query.filter(Question.id <= max_id)
+    return query.order_by(Question.id).execution_options(
+        stream_results=True).yield_per(export_batch_size)
+
+
+def export_chunks(rows, format):
+    ''' encodes the rows as NDJSON or CSV and yields the
+        text a batch of rows at a time, so that memory use
+        does not depend on the number of rows
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == 'csv':
+        writer.writerow(question_fields)
+    pending = 0
+    for row in rows:
+        if format == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(question_fields, row))))
+            buffer.write('\n')
+        pending += 1
+        if pending == export_batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -1,7 +1,12 @@
-def isValidQuestion(data):
-    ''' checks whether the proper body was sent in
-        the add question request
-     '''
+from ..serializers import question_fields
+from .pagination import listing_parts, QUESTIONS_MAX_PER_PAGE
+from .quiz import QUIZ_BATCH_MAX
+
+
+def hasQuestionFields(data):
+    ''' checks whether all the fields of a question are
+        present and not empty
+    '''
     # these are required fields
     expected = [
         'question',
@@ -16,6 +21,28 @@ def isValidQuestion(data):
     return isValid
 
 
+def isInteger(value):
+    ''' checks whether a value is an integer or a string of one,
+        like the values of the selects of the frontend
+    '''
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return False
+    try:
+        int(value)
+    except ValueError:
+        return False
+    return True
+
+
+def isValidQuestion(data):
+    ''' checks whether the proper body was sent in
+        the add question request, with integer category
+        and difficulty
+     '''
+    return hasQuestionFields(data) and all(
+        isInteger(data[key]) for key in ('category', 'difficulty'))
+
+
 def isValidQuizRequest(data):
     ''' checks whether the proper body was sent in
         the quiz request
@@ -29,3 +56,102 @@ def isValidQuizRequest(data):
         if key not in data.keys():
             isValid = False
     return isValid
+
+
+def isValidPage(page, limit):
+    ''' checks whether the page and limit sent in
+        a request body are positive integers, the limit
+        up to QUESTIONS_MAX_PER_PAGE
+    '''
+    return all(
+        isinstance(value, int) and not isinstance(value, bool) and value > 0
+        for value in (page, limit)) and limit <= QUESTIONS_MAX_PER_PAGE
+
+
+def isValidQuizSessionRequest(data):
+    ''' checks whether the proper body was sent in
+        the request that starts a quiz session
+    '''
+    return (
+        isinstance(data.get('quiz_category'), dict)
+        and 'id' in data['quiz_category']
+        and isinstance(data.get('previous_questions', []), list))
+
+
+def isValidQuizBatch(count, seed):
+    ''' checks whether the number of questions and the seed
+        of a batch quiz request are integers, the number in range
+    '''
+    return all(
+        isinstance(value, int) and not isinstance(value, bool)
+        for value in (count, seed)
+    ) and 0 < count <= QUIZ_BATCH_MAX
+
+
+def isValidQuestionSelection(selection, max_ids):
+    ''' checks whether a bulk request picks the questions
+        with a list of up to max_ids ids or with filters,
+        all of them integers
+    '''
+    values = [value for key, value in selection.items() if key != 'ids']
+    if 'ids' in selection:
+        ids = selection['ids']
+        if not isinstance(ids, list) or not 0 < len(ids) <= max_ids:
+            return False
+        values.extend(ids)
+    return bool(selection) and all(
+        isinstance(value, int) and not isinstance(value, bool)
+        for value in values)
+
+
+def isValidQuestionChanges(changes):
+    ''' checks whether the changes of a bulk update only set
+        question fields, with non empty text and integer ids
+    '''
+    types = {
+        'question': str,
+        'answer': str,
+        'category': int,
+        'difficulty': int
+    }
+    return isinstance(changes, dict) and bool(changes) and all(
+        key in types and isinstance(value, types[key])
+        and not isinstance(value, bool) and value != ''
+        for key, value in changes.items())
+
+
+def isValidDifficulty(difficulty):
+    ''' checks whether the difficulty of a quiz request is a range,
+        {"min": 1, "max": 3} with either bound, or a distribution,
+        {"weights": {"1": 0.2, "2": 0.8}} with some positive weight
+    '''
+    if not isinstance(difficulty, dict):
+        return False
+    if set(difficulty) == {'weights'}:
+        weights = difficulty['weights']
+        return isinstance(weights, dict) and all(
+            isinstance(key, str) and key.lstrip('-').isdigit()
+            and isinstance(weight, (int, float))
+            and not isinstance(weight, bool) and weight >= 0
+            for key, weight in weights.items()
+        ) and sum(weights.values()) > 0
+    if not difficulty or not set(difficulty) <= {'min', 'max'}:
+        return False
+    if not all(
+            isinstance(value, int) and not isinstance(value, bool)
+            for value in difficulty.values()):
+        return False
+    return difficulty.get('min', difficulty.get('max')) <= difficulty.get(
+        'max', difficulty.get('min'))
+
+
+def isValidFields(fields):
+    ''' checks whether a listing names some question fields
+        and nothing else
+    '''
+    return bool(fields) and set(fields) <= set(question_fields)
+
+
+def isValidInclude(include):
+    ''' checks whether a listing only includes known parts '''
+    return set(include) <= set(listing_parts)
@@ -0,0 +1,351 @@
+import bisect
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from array import array
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes, object_session
+
+from ..models import db, Question
+from ..replicas import primary_reads
+from .alias import AliasTable
+
+
+question_id_index = os.getenv(
+    'QUESTION_ID_INDEX', 'false').lower() in ('1', 'true', 'yes')
+question_id_index_resync = float(os.getenv('QUESTION_ID_INDEX_RESYNC', 300))
+
+'''
+QuestionIdIndex
+    keeps the ids of the questions of every category and
+    difficulty in memory, as sorted arrays of 32 bit integers,
+    the buckets of the index. The quizzes pick their
+    questions from it and only fetch the rows they return, and
+    the `index` count strategy answers total_questions from it.
+    It is loaded with a single query, updated by the ORM writes
+    of this process and reloaded every `resync` seconds to pick
+    up the writes of other processes. Bulk writes make it stale,
+    it is loaded again on next use.
+'''
+
+
+def sample_ids(pools, excluded, count, generator):
+    ''' picks up to `count` distinct ids from the sorted arrays
+        that are not excluded
+    '''
+    ends = list(itertools.accumulate(len(pool) for pool in pools))
+    total = ends[-1] if ends else 0
+    available = total - sum(
+        1 for id in excluded if any(contains(pool, id) for pool in pools))
+    count = min(count, available)
+    if count <= 0:
+        return []
+    if (available - count) * 2 < total:
+        # most draws would be rejected, the available ids are listed
+        candidates = [
+            id for pool in pools for id in pool if id not in excluded]
+        return generator.sample(candidates, count)
+    picked, seen = [], set(excluded)
+    while len(picked) < count:
+        position = generator.randrange(total)
+        number = bisect.bisect_right(ends, position)
+        id = pools[number][position - (ends[number - 1] if number else 0)]
+        if id not in seen:
+            seen.add(id)
+            picked.append(id)
+    return picked
+
+
+def category_key(category):
+    # the category of a question built from a request body
+    # can be a string until it is loaded again
+    return None if category is None else int(category)
+
+
+def bucket_key(category, difficulty):
+    return category_key(category), category_key(difficulty)
+
+
+def category_buckets(ids, category):
+    ''' the keys and the arrays of the buckets of the category,
+        or of every category when it is None, in a stable
+        order so that a seeded generator always picks the
+        same ids
+    '''
+    if category is not None:
+        category = category_key(category)
+    return [
+        (key, ids[key]) for key in sorted(ids, key=str)
+        if category is None or key[0] == category
+    ]
+
+
+def pick_available(pool, available, excluded, generator):
+    ''' a random id of the pool that is not excluded, `available`
+        of them are not
+    '''
+    if available * 2 < len(pool):
+        return generator.choice([id for id in pool if id not in excluded])
+    while True:
+        id = pool[generator.randrange(len(pool))]
+        if id not in excluded:
+            return id
+
+
+def contains(pool, id):
+    index = bisect.bisect_left(pool, id)
+    return index < len(pool) and pool[index] == id
+
+
+class QuestionIdIndex:
+
+    def __init__(self, enabled=question_id_index,
+                 resync=question_id_index_resync):
+        self.enabled = enabled
+        self.resync = resync
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._ids = None
+        self._loaded_at = 0
+        self.load_seconds = None
+        self.loads = 0
+
+    def _query(self):
+        ''' the sorted ids of every category and difficulty '''
+        if db.engine.dialect.name == 'postgresql':
+            rows = db.session.execute(
+                'SELECT category, difficulty, array_agg(id ORDER BY id) '
+                'FROM {} GROUP BY category, difficulty'.format(
+                    Question.__tablename__))
+            return {
+                (category, difficulty): array('i', ids)
+                for category, difficulty, ids in rows
+            }
+        ids = {}
+        rows = db.session.query(
+            Question.category, Question.difficulty, Question.id).order_by(
+                Question.category, Question.difficulty, Question.id)
+        for category, difficulty, id in rows:
+            ids.setdefault((category, difficulty), array('i')).append(id)
+        return ids
+
+    def load(self):
+        start = time.perf_counter()
+        with primary_reads():
+            ids = self._query()
+        with self._lock:
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+            self.load_seconds = time.perf_counter() - start
+            self.loads += 1
+        return ids
+
+    def _loaded(self):
+        ''' the arrays by category, loaded when missing and reloaded
+            when expired. Only one thread reloads an expired index,
+            the others keep using it meanwhile.
+        '''
+        with self._lock:
+            ids = self._ids
+            expired = time.monotonic() - self._loaded_at > self.resync
+        if ids is None:
+            with self._load_lock:
+                with self._lock:
+                    ids = self._ids
+                if ids is None:
+                    ids = self.load()
+        elif expired and self._load_lock.acquire(blocking=False):
+            try:
+                ids = self.load()
+            finally:
+                self._load_lock.release()
+        return ids
+
+    def add(self, category, difficulty, id):
+        with self._lock:
+            if self._ids is None:
+                return
+            pool = self._ids.setdefault(
+                bucket_key(category, difficulty), array('i'))
+            index = bisect.bisect_left(pool, id)
+            if index == len(pool) or pool[index] != id:
+                pool.insert(index, id)
+
+    def remove(self, category, difficulty, id):
+        with self._lock:
+            pool = (self._ids or {}).get(bucket_key(category, difficulty))
+            if pool is not None:
+                index = bisect.bisect_left(pool, id)
+                if index < len(pool) and pool[index] == id:
+                    del pool[index]
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+    def count(self, category=None):
+        ids = self._loaded()
+        with self._lock:
+            return sum(
+                len(pool) for _, pool in category_buckets(ids, category))
+
+    def sample(self, category, previous_questions, count, generator=random):
+        ''' picks up to `count` distinct random question ids of the
+            category, or of every category when it is None, that
+            are not in previous_questions
+        '''
+        ids = self._loaded()
+        with self._lock:
+            pools = [pool for _, pool in category_buckets(ids, category)]
+            return sample_ids(
+                pools, set(previous_questions), count, generator)
+
+    def sample_weighted(self, category, previous_questions, count, weigh,
+                        generator=random):
+        ''' picks up to `count` distinct question ids of the category,
+            or of every category when it is None, that are not in
+            previous_questions. Every pick draws a bucket from an
+            alias table of the weights that weigh(keys, available)
+            gives the buckets, from their keys and the number of
+            their ids that can still be picked, then an id of the
+            bucket. The table is built again when a bucket runs out.
+        '''
+        ids = self._loaded()
+        excluded = set(previous_questions)
+        picked = []
+        with self._lock:
+            buckets = category_buckets(ids, category)
+            keys = [key for key, _ in buckets]
+            available = [
+                len(pool) - sum(1 for id in excluded if contains(pool, id))
+                for _, pool in buckets
+            ]
+            table = None
+            while len(picked) < count:
+                if table is None:
+                    weights = [
+                        weight if left else 0 for weight, left in zip(
+                            weigh(keys, available), available)
+                    ]
+                    if not any(weight > 0 for weight in weights):
+                        break
+                    table = AliasTable(weights)
+                number = table.pick(generator)
+                id = pick_available(
+                    buckets[number][1], available[number], excluded,
+                    generator)
+                excluded.add(id)
+                picked.append(id)
+                available[number] -= 1
+                if not available[number]:
+                    table = None
+        return picked
+
+    def stats(self):
+        with self._lock:
+            ids = self._ids
+            stats = {
+                'enabled': self.enabled,
+                'loaded': ids is not None,
+                'loads': self.loads,
+                'load_ms': self.load_seconds and self.load_seconds * 1000
+            }
+            if ids is not None:
+                stats.update({
+                    'categories': len({category for category, _ in ids}),
+                    'buckets': len(ids),
+                    'questions': sum(len(pool) for pool in ids.values()),
+                    'memory_bytes': sys.getsizeof(ids) + sum(
+                        sys.getsizeof(pool) for pool in ids.values()),
+                    'age_seconds': time.monotonic() - self._loaded_at
+                })
+        return stats
+
+
+question_index = QuestionIdIndex()
+
+
+def init_question_index(app):
+    ''' loads the index when the application starts, a preloading
+        server shares it with the workers it forks
+    '''
+    if question_index.enabled:
+        with app.app_context():
+            question_index.load()
+            db.session.remove()
+
+
+'''
+index maintenance hooks
+    the questions written through the ORM are recorded on the
+    session and applied to the index once their transaction
+    commits, bulk writes that can move or remove questions
+    make the index stale
+'''
+
+
+def record_index_change(target, *change):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('question_index_changes', []).append(change)
+
+
+@event.listens_for(Question, 'after_insert')
+def index_inserted_question(mapper, connection, target):
+    record_index_change(
+        target, True, target.category, target.difficulty, target.id)
+
+
+@event.listens_for(Question, 'after_delete')
+def index_deleted_question(mapper, connection, target):
+    record_index_change(
+        target, False, target.category, target.difficulty, target.id)
+
+
+@event.listens_for(Question, 'after_update')
+def index_moved_question(mapper, connection, target):
+    category = attributes.get_history(target, 'category').deleted
+    difficulty = attributes.get_history(target, 'difficulty').deleted
+    if category or difficulty:
+        record_index_change(
+            target, False,
+            category[0] if category else target.category,
+            difficulty[0] if difficulty else target.difficulty,
+            target.id)
+        record_index_change(
+            target, True, target.category, target.difficulty, target.id)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def stale_index_on_bulk_write(context):
+    if context.mapper.class_ is not Question:
+        return
+    # a delete, or an update that can move questions
+    values = getattr(context, 'values', None)
+    if values is None or any(
+            getattr(key, 'key', key) in ('category', 'difficulty')
+            for key in values):
+        context.session.info['question_index_stale'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_index_changes(session):
+    changes = session.info.pop('question_index_changes', ())
+    if session.info.pop('question_index_stale', False):
+        question_index.invalidate()
+        return
+    for present, category, difficulty, id in changes:
+        if present:
+            question_index.add(category, difficulty, id)
+        else:
+            question_index.remove(category, difficulty, id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_index_changes(session):
+    session.info.pop('question_index_changes', None)
+    session.info.pop('question_index_stale', None)
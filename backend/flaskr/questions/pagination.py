@@ -0,0 +1,41 @@
+from flask import abort, request
+
+from ..models import Question
+
+
+QUESTIONS_PER_PAGE = 10
+QUESTIONS_MAX_PER_PAGE = 1000
+# the parts of GET /questions that `include` can leave out
+listing_parts = ('categories',)
+
+
+def paginate_questions(query):
+    ''' applies the pagination requested in the query string
+        to a questions query.
+
+        The `cursor` (or `after_id`) argument selects keyset
+        pagination, which seeks past the last question id that
+        was seen, otherwise the `page` argument is used as
+        an offset. Both modes are ordered by id so that pages
+        are stable.
+        Returns the questions on the page and the cursor
+        to use for the next page or None on the last page,
+        aborts with a 400 for a page or limit out of range.
+    '''
+    limit = request.args.get('limit', QUESTIONS_PER_PAGE, type=int)
+    page = request.args.get('page', 1, type=int)
+    # the arguments that are not integers get their defaults
+    if not (0 < limit <= QUESTIONS_MAX_PER_PAGE and page > 0):
+        abort(400)
+    cursor = request.args.get('cursor', type=int)
+    if cursor is None:
+        cursor = request.args.get('after_id', type=int)
+    query = query.order_by(Question.id)
+    if cursor is not None:
+        query = query.filter(Question.id > cursor)
+    else:
+        query = query.offset((page - 1) * limit)
+    # fetch one extra row to know whether there is a next page
+    questions = query.limit(limit + 1).all()
+    next_cursor = questions[limit - 1].id if len(questions) > limit else None
+    return questions[:limit], next_cursor
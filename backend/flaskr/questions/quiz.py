@@ -0,0 +1,223 @@
+import random
+
+from ..models import db, Question
+from ..serializers import question_fields, question_rows
+from .index import question_index
+
+
+ALL_CATEGORIES = 0  # ID zero is for all categories
+QUIZ_BATCH_MAX = 50
+# the seeds of batches are below this bound, the random ones too
+QUIZ_SEED_LIMIT = 2 ** 32
+# pools of available questions up to this size are shuffled
+# whole, larger ones are sampled at random pivots
+QUIZ_SHUFFLE_POOL = 1000
+
+
+def quiz_conditions(category_id, previous_questions):
+    ''' the conditions on the questions that are still
+        available in a quiz
+    '''
+    conditions = []
+    if category_id != ALL_CATEGORIES:
+        conditions.append(Question.category == category_id)
+    if previous_questions:
+        conditions.append(Question.id.notin_(previous_questions))
+    return conditions
+
+
+def quiz_question_query(category_id, previous_questions):
+    ''' builds the query for the questions that are still
+        available in a quiz, with the category filter and the
+        exclusion of previous questions done by the database
+    '''
+    return Question.query.filter(
+        *quiz_conditions(category_id, previous_questions))
+
+
+def index_category(category_id):
+    ''' the category of the question id index for a quiz category '''
+    return None if category_id == ALL_CATEGORIES else category_id
+
+
+def select_quiz_question(category_id, previous_questions):
+    ''' picks a random question for the quiz without loading
+        the question bank into memory.
+
+        A random pivot is drawn from the id range of the
+        available questions and the first question at or after
+        the pivot is returned, so each call costs an aggregate
+        over the id range plus a single row fetch. Questions
+        that follow a gap in the ids are slightly more likely
+        to be picked than others.
+        With the question id index the question is drawn from it
+        and only its row is fetched, the database picks it when
+        the index has no question left or a question that is gone.
+        Returns None when there are no questions left.
+    '''
+    if question_index.enabled:
+        ids = question_index.sample(
+            index_category(category_id), previous_questions, 1)
+        question = Question.query.get(ids[0]) if ids else None
+        if question is not None:
+            return question
+    query = quiz_question_query(category_id, previous_questions)
+    low, high = query.with_entities(
+        db.func.min(Question.id), db.func.max(Question.id)).one()
+    if low is None:
+        return None
+    pivot = random.randint(low, high)
+    return query.filter(
+        Question.id >= pivot).order_by(Question.id).limit(1).first()
+
+
+def rows_in_order(ids):
+    ''' the question column tuples of the ids that are still
+        stored, in the order of the ids
+    '''
+    rows = question_rows().filter(Question.id.in_(ids)).all()
+    order = {id: number for number, id in enumerate(ids)}
+    return sorted(rows, key=lambda row: order[row.id])
+
+
+def available_conditions(category_id, previous_questions):
+    ''' the SQL conditions on the questions that are still
+        available in a quiz and their parameters, for the
+        statements written as text
+    '''
+    conditions = ['1 = 1']
+    parameters = {}
+    if category_id != ALL_CATEGORIES:
+        conditions.append('category = :category')
+        parameters['category'] = category_id
+    if previous_questions:
+        conditions.append('id NOT IN :previous')
+        parameters['previous'] = list(previous_questions)
+    return conditions, parameters
+
+
+def select_quiz_questions(category_id, previous_questions, count, seed):
+    ''' picks up to `count` distinct questions for the quiz,
+        the same ones in the same order for the same seed as
+        long as the questions do not change.
+        With the question id index the ids are drawn from it with
+        the seed, otherwise the database samples them.
+    '''
+    if question_index.enabled:
+        ids = question_index.sample(
+            index_category(category_id), previous_questions, count,
+            random.Random(seed))
+        rows = rows_in_order(ids)
+        if ids and len(rows) == len(ids):
+            return rows
+    conditions, parameters = available_conditions(
+        category_id, previous_questions)
+    return sample_quiz_questions(
+        conditions, parameters, count, random.Random(seed))
+
+
+def run_statement(statement, parameters):
+    ''' runs a statement written as text, with the lists in
+        its parameters expanded
+    '''
+    statement = db.text(statement)
+    for name, value in parameters.items():
+        if isinstance(value, list):
+            statement = statement.bindparams(
+                db.bindparam(name, expanding=True))
+    return db.session.execute(statement, parameters).fetchall()
+
+
+def sample_quiz_questions(conditions, parameters, count, generator):
+    ''' picks up to `count` distinct questions among the ones
+        that meet the conditions, with the generator.
+
+        The candidate ids are found in a single query. Small
+        pools of available questions are taken whole. Larger
+        pools are sampled at twice as many seeded random pivots
+        in their id range as questions requested, each pivot
+        costs an index lookup, so the query does not scan the
+        pool. Pivots that fall in a gap of the ids pick the same
+        question, a short sample is topped up with the questions
+        after one more pivot. The questions are drawn from the
+        candidates with the generator.
+        The statements are written as text, building the pivot
+        subqueries with the expression language costs more than
+        running them.
+    '''
+    candidates = run_statement(*quiz_sample_statement(
+        conditions, parameters, count, generator))
+    rows = generator.sample(candidates, min(count, len(candidates)))
+    if len(rows) < count:
+        missing = count - len(rows)
+        rows += top_up_rows(run_statement(*quiz_top_up_statement(
+            conditions, parameters, [row.id for row in rows], missing,
+            generator.random())), missing)
+        generator.shuffle(rows)
+    return rows
+
+
+def quiz_sample_statement(conditions, parameters, count, generator):
+    ''' the statement that finds the candidates of
+        sample_quiz_questions and its parameters, with a pivot
+        drawn from the generator for every subquery
+    '''
+    available = ' AND '.join(conditions)
+    parameters = dict(parameters, pool=QUIZ_SHUFFLE_POOL)
+    pivots = []
+    for number in range(2 * count):
+        pivots.append(
+            '(SELECT min(id) FROM questions WHERE {} AND id >= ('
+            'SELECT CAST(low + (high - low) * CAST(:fraction_{} AS FLOAT) '
+            'AS INTEGER) FROM bounds))'.format(available, number))
+        parameters['fraction_{}'.format(number)] = generator.random()
+    statement = (
+        'WITH bounds AS ('
+        'SELECT min(id) AS low, max(id) AS high FROM questions WHERE {0}) '
+        'SELECT {1} FROM questions WHERE {0} AND ('
+        'SELECT count(*) FROM (SELECT id FROM questions WHERE {0} '
+        'LIMIT :pool + 1) AS pool) <= :pool '
+        'UNION SELECT {1} FROM questions WHERE id IN ({2}) '
+        'ORDER BY id'.format(
+            available, ', '.join(question_fields), ', '.join(pivots)))
+    return statement, parameters
+
+
+def quiz_top_up_statement(conditions, parameters, chosen, missing, fraction):
+    ''' the statement of the questions that follow a seeded random
+        pivot in the id range of the available ones, wrapping
+        around to the lowest ids, that were not chosen yet, and
+        its parameters.
+
+        Pivots that land in a gap of the ids all resolve to the
+        question after the gap, so a sample can come back short
+        of the pool. Two index range scans of `missing` rows fill
+        it up to the questions requested.
+    '''
+    available = ' AND '.join(conditions)
+    remaining = available
+    parameters = dict(parameters, missing=missing, fraction=fraction)
+    if chosen:
+        remaining += ' AND id NOT IN :chosen'
+        parameters['chosen'] = chosen
+    part = (
+        'SELECT * FROM (SELECT {0}, {2} AS part FROM questions '
+        'WHERE {1} AND id {3} (SELECT CAST(low + (high - low) * '
+        'CAST(:fraction AS FLOAT) AS INTEGER) FROM bounds) '
+        'ORDER BY id LIMIT :missing) AS part_{2}')
+    fields = ', '.join(question_fields)
+    statement = (
+        'WITH bounds AS ('
+        'SELECT min(id) AS low, max(id) AS high FROM questions WHERE {}) '
+        '{} UNION ALL {}'.format(
+            available, part.format(fields, remaining, 0, '>='),
+            part.format(fields, remaining, 1, '<')))
+    return statement, parameters
+
+
+def top_up_rows(rows, missing):
+    ''' the first `missing` rows of the top up statement, the ones
+        after the pivot and then the ones from the lowest ids.
+        The part column comes last, past the question fields.
+    '''
+    return sorted(rows, key=lambda row: (row['part'], row['id']))[:missing]
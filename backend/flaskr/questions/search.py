@@ -0,0 +1,92 @@
+import re
+
+from ..models import db, Question
+from ..serializers import question_rows
+
+
+search_index_name = 'ix_questions_question_fts'
+# the text search configuration of the index, 'simple' lowercases
+# the words without stemming them or dropping stop words
+search_configuration = 'simple'
+
+
+def escape_like(term):
+    ''' escapes the LIKE wildcards so that they are matched literally '''
+    return (
+        term.replace('\\', '\\\\')
+        .replace('%', '\\%')
+        .replace('_', '\\_'))
+
+
+class LikeSearch:
+    ''' case insensitive substring search that runs on any
+        database, SQLite included. No index can serve it.
+    '''
+
+    def condition(self, term):
+        return db.func.lower(Question.question).like(
+            '%{}%'.format(escape_like(term.lower())), escape='\\')
+
+    def ordering(self, term):
+        return [Question.id]
+
+
+class FullTextSearch(LikeSearch):
+    ''' Postgres full text search served by the GIN index of
+        migration 1. Every word of the term matches as a prefix
+        of a word in the question, and results are ranked
+        with ts_rank. Terms without any word fall back to
+        the substring search.
+    '''
+
+    def query(self, term):
+        words = re.findall(r'\w+', term)
+        if not words:
+            return None
+        return db.func.to_tsquery(
+            search_configuration,
+            ' & '.join('{}:*'.format(word) for word in words))
+
+    def document(self):
+        return db.func.to_tsvector(search_configuration, Question.question)
+
+    def condition(self, term):
+        query = self.query(term)
+        if query is None:
+            return super().condition(term)
+        return self.document().op('@@')(query)
+
+    def ordering(self, term):
+        query = self.query(term)
+        if query is None:
+            return super().ordering(term)
+        return [db.func.ts_rank(self.document(), query).desc(), Question.id]
+
+
+search_backends = {}
+
+
+def search_backend():
+    ''' picks the full text search when its index exists,
+        the choice is made once per engine
+    '''
+    engine = db.engine
+    if engine not in search_backends:
+        indexed = engine.dialect.name == 'postgresql' and db.session.execute(
+            'SELECT 1 FROM pg_indexes WHERE indexname = :name',
+            {'name': search_index_name}).scalar()
+        search_backends[engine] = FullTextSearch() if indexed else LikeSearch()
+    return search_backends[engine]
+
+
+def search_questions(term, page, limit):
+    ''' returns a page of the question rows matching the term,
+        most relevant first, and the total number of matches
+    '''
+    backend = search_backend()
+    condition = backend.condition(term)
+    total = db.session.query(
+        db.func.count(Question.id)).filter(condition).scalar()
+    questions = question_rows().filter(condition).order_by(
+        *backend.ordering(term)).offset((page - 1) * limit).limit(limit).all()
+    return questions, total
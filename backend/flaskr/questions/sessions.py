@@ -0,0 +1,163 @@
+import os
+import random
+import secrets
+import threading
+import time
+from collections import deque, OrderedDict
+
+from ..backends import redis_client
+from ..models import Question
+from .index import question_index
+from .quiz import index_category, quiz_question_query
+
+
+quiz_session_backend = os.getenv('QUIZ_SESSION_BACKEND', 'memory')
+quiz_session_ttl = int(os.getenv('QUIZ_SESSION_TTL', 3600))
+# the longest quiz a session can hold, larger categories are sampled
+quiz_session_max_questions = int(
+    os.getenv('QUIZ_SESSION_MAX_QUESTIONS', 1000))
+quiz_session_max_sessions = int(
+    os.getenv('QUIZ_SESSION_MAX_SESSIONS', 10000))
+
+'''
+Session stores
+    keep the shuffled question ids of every quiz session
+    and hand them out one at a time
+'''
+
+
+class MemorySessionStore:
+    ''' keeps the sessions of this process in memory. Sessions
+        expire after `ttl` seconds and the oldest ones are
+        evicted beyond `max_sessions`.
+    '''
+
+    def __init__(self, ttl=quiz_session_ttl,
+                 max_sessions=quiz_session_max_sessions):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def _expire(self, now):
+        # sessions are kept in creation order and share the same
+        # ttl, so the expired ones are always at the front
+        while self._sessions:
+            session_id, (_, expires_at) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def create(self, session_id, question_ids):
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[session_id] = (deque(question_ids), now + self.ttl)
+            self._expire(now)
+
+    def pop(self, session_id):
+        ''' returns the next question id of the session, or None
+            when the session is unknown, expired or exhausted
+        '''
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            return entry[0].popleft() if entry[0] else None
+
+    def remaining(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return len(entry[0]) if entry else 0
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+
+class RedisSessionStore:
+    ''' keeps the sessions in a Redis list per session, so that
+        every worker can serve every session
+    '''
+    key_prefix = 'trivia:quiz-session:'
+
+    def __init__(self, url, ttl=quiz_session_ttl):
+        self.redis = redis_client(url)
+        self.ttl = ttl
+
+    def _key(self, session_id):
+        return self.key_prefix + session_id
+
+    def create(self, session_id, question_ids):
+        key = self._key(session_id)
+        pipeline = self.redis.pipeline()
+        for start in range(0, len(question_ids), 1000):
+            pipeline.rpush(key, *question_ids[start:start + 1000])
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
+
+    def pop(self, session_id):
+        question_id = self.redis.lpop(self._key(session_id))
+        return int(question_id) if question_id is not None else None
+
+    def remaining(self, session_id):
+        return self.redis.llen(self._key(session_id))
+
+    def delete(self, session_id):
+        return bool(self.redis.delete(self._key(session_id)))
+
+
+def create_session_store(backend):
+    if backend == 'memory':
+        return MemorySessionStore()
+    return RedisSessionStore(backend)
+
+
+session_store = create_session_store(quiz_session_backend)
+
+
+def create_quiz_session(category_id, previous_questions=()):
+    ''' shuffles the ids of the questions available for the quiz
+        and stores them under a new session id.
+        Returns the session id and the number of questions,
+        or None when there are no questions to play.
+    '''
+    if question_index.enabled:
+        # the questions that were deleted since the index was
+        # loaded are skipped by next_quiz_question
+        question_ids = question_index.sample(
+            index_category(category_id), previous_questions,
+            quiz_session_max_questions)
+    else:
+        question_ids = [
+            id for id, in quiz_question_query(
+                category_id, previous_questions).with_entities(Question.id)
+        ]
+        question_ids = random.sample(
+            question_ids, min(len(question_ids), quiz_session_max_questions))
+    if not question_ids:
+        return None
+    session_id = secrets.token_urlsafe(16)
+    session_store.create(session_id, question_ids)
+    return session_id, len(question_ids)
+
+
+def next_quiz_question(session_id):
+    ''' returns the next question of the session or None when
+        there are no questions left. Questions deleted since
+        the session started are skipped.
+    '''
+    while True:
+        question_id = session_store.pop(session_id)
+        if question_id is None:
+            return None
+        question = Question.query.get(question_id)
+        if question is not None:
+            return question
+
+
+def remaining_quiz_questions(session_id):
+    return session_store.remaining(session_id)
+
+
+def end_quiz_session(session_id):
+    return session_store.delete(session_id)
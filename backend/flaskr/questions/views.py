@@ -1,39 +1,72 @@
 import json
 import random
-from flask import request, abort, jsonify, Blueprint
+from flask import (
+    request, abort, jsonify, Blueprint, Response, stream_with_context)
+from sqlalchemy.exc import IntegrityError
 
-from ..models import db, Question, Category
-from .helpers import isValidQuestion, isValidQuizRequest
+from ..cache import category_cache, response_cache
+from ..idempotency import idempotent_requests
+from ..models import db, Question, question_content_hash
+from ..replicas import replica_set
+from ..serializers import (
+    question_rows, format_rows, json_response, question_fields,
+    requested_names, selected_fields)
+from .bulk import (
+    import_questions, read_records, import_formats, read_selection,
+    delete_questions, update_questions, bulk_max_ids, insert_question)
+from .counts import count_questions, record_insert, record_delete
+from .difficulty import select_difficulty_question, select_difficulty_questions
+from .export import (
+    export_query, export_chunks, export_formats, export_mimetypes)
+from .helpers import (
+    isValidQuestion, isValidQuizRequest, isValidPage,
+    isValidQuizSessionRequest, isValidQuizBatch, isValidQuestionSelection,
+    isValidQuestionChanges, isValidFields, isValidInclude, isValidDifficulty)
+from .index import question_index
+from .pagination import paginate_questions, QUESTIONS_PER_PAGE, listing_parts
+from .quiz import (
+    QUIZ_SEED_LIMIT, select_quiz_question, select_quiz_questions)
+from .search import search_questions
+from .sessions import (
+    create_quiz_session, next_quiz_question, remaining_quiz_questions,
+    end_quiz_session)
 
 
-QUESTIONS_PER_PAGE = 10
-
 question = Blueprint('question', __name__)
 '''
 Endpoint to handle GET requests for questions,
-including pagination (every 10 questions).
+including pagination (every 10 questions) by page
+number or by cursor.
 This endpoint returns a list of questions,
 number of total questions, current category, categories.
+`fields` selects the question fields to return and
+`include` the optional parts of the response.
 '''
 @question.route('/questions', methods=['GET'])
+@response_cache.cached
+@replica_set.reads
 def retrieve_questions():
-    page = request.args.get('page', 1, type=int)
-    limit = request.args.get('limit', QUESTIONS_PER_PAGE, type=int)
-    offset = (page - 1) * limit
     try:
-        questions = Question.query.offset(offset).limit(limit).all()
+        fields = requested_names('fields', question_fields)
+        include = requested_names('include', listing_parts)
+        if not isValidFields(fields) or not isValidInclude(include):
+            abort(400)
+        fields = selected_fields(fields)
+        questions, next_cursor = paginate_questions(question_rows(fields))
         if not questions:
             abort(404)
-        categories = Category.query.all()
-        total_questions = db.session.query(
-            db.func.count(Question.id).label('total')).all()
-        return jsonify({
+        total_questions, exact = count_questions()
+        body = {
             'success': True,
-            'questions': [question.format() for question in questions],
-            'categories': [category.format() for category in categories],
-            'total_questions': total_questions[0].total,
-            'current_category': None
-        }), 200
+            'questions': format_rows(questions, fields),
+            'total_questions': total_questions,
+            'total_questions_exact': exact,
+            'current_category': None,
+            'next_cursor': next_cursor
+        }
+        if 'categories' in include:
+            body['categories'] = category_cache.all()
+        return json_response(body), 200
     except Exception as error:
         raise error
     finally:
@@ -42,34 +75,172 @@ def retrieve_questions():
 
 '''
 Endpoint to POST a new question or search questions
-by a search term
+by a search term, a page of search results is returned.
+A question that is already stored is not added again,
+the stored one is returned with a 200.
 '''
 @question.route('/questions', methods=['POST'])
+@idempotent_requests.idempotent
 def add_or_search_questions():
     try:
         data = json.loads(request.data)
         if 'searchTerm' in data.keys():
             if data['searchTerm'] == '':
                 abort(400)
-            search_format = '%{}%'.format(data['searchTerm'].lower())
-            questions = Question.query.filter(
-                db.func.lower(Question.question)
-                .like(search_format)).all()
-            return jsonify({
+            page = data.get('page', 1)
+            limit = data.get('limit', QUESTIONS_PER_PAGE)
+            if not isValidPage(page, limit):
+                abort(400)
+            questions, total_questions = search_questions(
+                data['searchTerm'], page, limit)
+            return json_response({
                 'success': True,
-                'questions': [question.format() for question in questions],
-                'total_questions': len(questions),
+                'questions': format_rows(questions),
+                'total_questions': total_questions,
                 'current_category': None
             }), 200
         if not isValidQuestion(data):
             abort(400)
-        question = Question(**data)
-        db.session.add(question)
-        db.session.commit()
+        row = {
+            'question': data['question'],
+            'answer': data['answer'],
+            'category': int(data['category']),
+            'difficulty': int(data['difficulty'])
+        }
+        row['content_hash'] = question_content_hash(
+            row['question'], row['answer'])
+        try:
+            id, inserted = insert_question(row)
+            db.session.commit()
+        except IntegrityError:
+            # the category does not exist
+            db.session.rollback()
+            abort(422)
+        question = Question.query.get(id)
+        if not inserted and question.category != row['category']:
+            # the same question is stored in another category, or
+            # in its category when the one requested does not exist
+            abort(422)
+        if inserted:
+            # the row is inserted without the ORM, which does
+            # not see it, the caches are updated here
+            record_insert(question.category)
+            response_cache.invalidate()
+            question_index.add(question.category, question.difficulty, id)
         return jsonify({
             'success': True,
             'data': question.format()
-        }), 201
+        }), 201 if inserted else 200
+    except Exception as error:
+        raise error
+    finally:
+        db.session.close()
+
+
+'''
+Endpoint to GET a dump of the questions as NDJSON or CSV,
+streamed so that the response can be any size.
+'''
+@question.route('/questions/export')
+@replica_set.reads
+def export_questions():
+    format = request.args.get('format', 'ndjson')
+    if format not in export_formats:
+        abort(400)
+    rows = export_query(
+        category=request.args.get('category', type=int),
+        min_id=request.args.get('min_id', type=int),
+        max_id=request.args.get('max_id', type=int))
+
+    def generate():
+        # the session outlives the view function, it is
+        # closed once the whole response has been sent
+        try:
+            yield from export_chunks(rows, format)
+        finally:
+            db.session.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=export_mimetypes[format],
+        headers={
+            'Content-Disposition':
+                'attachment; filename=questions.{}'.format(format)
+        })
+
+
+'''
+Endpoint to POST many questions at once as a stream of
+JSON Lines or CSV. Invalid rows are reported and skipped.
+'''
+@question.route('/questions/import', methods=['POST'])
+def bulk_import_questions():
+    try:
+        format = request.args.get('format')
+        if format is None:
+            format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        chunk_size = request.args.get('chunk_size', type=int)
+        if format not in import_formats or (
+                chunk_size is not None and chunk_size < 1):
+            abort(400)
+        result = import_questions(
+            read_records(request.stream, format), chunk_size)
+        return jsonify({
+            'success': True,
+            **result.format()
+        }), 200
+    except Exception as error:
+        raise error
+    finally:
+        db.session.close()
+
+
+'''
+Endpoint to DELETE many questions at once, picked by a
+list of ids and/or filters, with a single statement.
+'''
+@question.route('/questions', methods=['DELETE'])
+def bulk_delete_questions():
+    try:
+        selection = read_selection(json.loads(request.data))
+        if not isValidQuestionSelection(selection, bulk_max_ids):
+            abort(400)
+        deleted = delete_questions(selection)
+        return jsonify({
+            'success': True,
+            'deleted': deleted
+        }), 200
+    except Exception as error:
+        raise error
+    finally:
+        db.session.close()
+
+
+'''
+Endpoint to PATCH many questions at once, the changes
+are applied to the questions picked by a list of ids
+and/or filters with a single statement.
+'''
+@question.route('/questions', methods=['PATCH'])
+def bulk_update_questions():
+    try:
+        data = json.loads(request.data)
+        selection = read_selection(data)
+        changes = data.get('changes')
+        if not isValidQuestionSelection(selection, bulk_max_ids) or \
+                not isValidQuestionChanges(changes):
+            abort(400)
+        try:
+            updated = update_questions(selection, changes)
+        except IntegrityError:
+            # the category does not exist or the changed
+            # questions would duplicate stored ones
+            db.session.rollback()
+            abort(422)
+        return jsonify({
+            'success': True,
+            'updated': updated
+        }), 200
     except Exception as error:
         raise error
     finally:
@@ -85,8 +256,10 @@ def delete_question(id):
         question = Question.query.get(id)
         if question is None:
             abort(422)
+        category = question.category
         db.session.delete(question)
         db.session.commit()
+        record_delete(category)
         return jsonify({
             'success': True,
             'message': f'Question with ID: {id} deleted'
@@ -102,15 +275,20 @@ Endpoint to handle GET requests
 for all available categories.
 '''
 @question.route('/categories')
+@response_cache.cached
+@replica_set.reads
 def retrieve_categories():
     try:
-        categories = Category.query.all()
+        categories, etag = category_cache.all_with_etag()
         if not categories:
             abort(404)
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'categories': [category.format() for category in categories]
-        }), 200
+            'categories': categories
+        })
+        # response_cache answers the conditional requests
+        response.set_etag(etag)
+        return response
     except Exception as error:
         raise error
     finally:
@@ -118,27 +296,31 @@ def retrieve_categories():
 
 
 '''
-Endpoint to get questions based on category.
+Endpoint to get questions based on category,
+`fields` selects the question fields to return.
 '''
 @question.route('/categories/<int:id>/questions')
+@response_cache.cached
+@replica_set.reads
 def retrieve_questions_by_category(id):
     try:
-        page = request.args.get('page', 1, type=int)
-        limit = request.args.get('limit', QUESTIONS_PER_PAGE, type=int)
-        offset = (page - 1) * limit
-        questions = Question.query.filter_by(
-            category=str(id)).offset(offset).limit(limit).all()
+        fields = requested_names('fields', question_fields)
+        if not isValidFields(fields):
+            abort(400)
+        fields = selected_fields(fields)
+        questions, next_cursor = paginate_questions(
+            question_rows(fields).filter(Question.category == id))
         if not questions:
             abort(404)
-        category = Category.query.get(id)
-        total_questions = db.session.query(
-            db.func.count(Question.id).label('total')
-            ).filter_by(category=str(id)).all()
-        return jsonify({
+        category = category_cache.get(id)
+        total_questions, exact = count_questions(id)
+        return json_response({
             'success': True,
-            'questions': [question.format() for question in questions],
-            'total_questions': total_questions[0].total,
-            'current_category': category.format()
+            'questions': format_rows(questions, fields),
+            'total_questions': total_questions,
+            'total_questions_exact': exact,
+            'current_category': category,
+            'next_cursor': next_cursor
         }), 200
     except Exception as error:
         raise error
@@ -147,31 +329,121 @@ def retrieve_questions_by_category(id):
 
 
 '''
-Endpoint to get questions to play the quiz.
+Endpoint to get questions to play the quiz. With a `count`
+or a `seed` in the body a batch of distinct questions is
+returned, the same batch for the same seed. A `difficulty`
+range or distribution picks the questions by difficulty.
 '''
 @question.route('/quizzes', methods=['POST'])
+@replica_set.reads
 def get_quiz_question():
     try:
         data = json.loads(request.data)
         if not isValidQuizRequest(data):
             abort(400)
-        result = db.session.query(Question).filter(
-            Question.id.notin_(data['previous_questions'])).all()
-        questions = [question.format() for question in result]
-        if data['quiz_category']['id'] != 0:  # ID zero is for all categories
-            questions = [
-                question
-                for question in questions
-                if question['category'] == data['quiz_category']['id']
-            ]
-        if not questions:
+        difficulty = data.get('difficulty')
+        if difficulty is not None and not isValidDifficulty(difficulty):
+            abort(400)
+        if 'count' in data or 'seed' in data:
+            count = data.get('count', 1)
+            seed = data.get('seed')
+            if seed is None:
+                seed = random.getrandbits(32)
+            if not isValidQuizBatch(count, seed):
+                abort(400)
+            if not 0 <= seed < QUIZ_SEED_LIMIT:
+                abort(422)
+            if difficulty is not None:
+                questions = select_difficulty_questions(
+                    data['quiz_category']['id'], data['previous_questions'],
+                    difficulty, count, seed)
+            else:
+                questions = select_quiz_questions(
+                    data['quiz_category']['id'], data['previous_questions'],
+                    count, seed)
+            if not questions:
+                abort(404)
+            return json_response({
+                'success': True,
+                'questions': format_rows(questions),
+                'seed': seed
+            }), 200
+        if difficulty is not None:
+            question = select_difficulty_question(
+                data['quiz_category']['id'], data['previous_questions'],
+                difficulty)
+        else:
+            question = select_quiz_question(
+                data['quiz_category']['id'], data['previous_questions'])
+        if question is None:
+            abort(404)
+        return jsonify({
+            'success': True,
+            'question': question.format()
+        }), 200
+    except Exception as error:
+        raise error
+    finally:
+        db.session.close()
+
+
+'''
+Endpoint to start a quiz session. The questions of the
+quiz are shuffled once and kept on the server, so the
+client does not need to send the previous questions.
+'''
+@question.route('/quiz-sessions', methods=['POST'])
+@replica_set.reads
+def start_quiz_session():
+    try:
+        data = json.loads(request.data)
+        if not isValidQuizSessionRequest(data):
+            abort(400)
+        session = create_quiz_session(
+            data['quiz_category']['id'], data.get('previous_questions', []))
+        if session is None:
             abort(404)
-        question = random.choice(questions)
+        session_id, total_questions = session
         return jsonify({
             'success': True,
-            'question': question
+            'session_id': session_id,
+            'total_questions': total_questions
+        }), 201
+    except Exception as error:
+        raise error
+    finally:
+        db.session.close()
+
+
+'''
+Endpoint to get the next question of a quiz session.
+'''
+@question.route('/quiz-sessions/<session_id>/next', methods=['POST'])
+@replica_set.reads
+def get_quiz_session_question(session_id):
+    try:
+        question = next_quiz_question(session_id)
+        if question is None:
+            abort(404)
+        return jsonify({
+            'success': True,
+            'question': question.format(),
+            'remaining_questions': remaining_quiz_questions(session_id)
         }), 200
     except Exception as error:
         raise error
     finally:
         db.session.close()
+
+
+'''
+Endpoint to DELETE a quiz session before it is exhausted.
+'''
+@question.route('/quiz-sessions/<session_id>', methods=['DELETE'])
+def delete_quiz_session(session_id):
+    if not end_quiz_session(session_id):
+        abort(404)
+    return jsonify({
+        'success': True,
+        'message': f'Quiz session {session_id} ended'
+    }), 200
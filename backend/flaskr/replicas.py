@@ -0,0 +1,185 @@
+import contextlib
+import functools
+import itertools
+import math
+import os
+import threading
+import time
+from collections import Counter
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+# for how long after a write the reads of the same client go to
+# the primary, it should exceed the replication lag
+replica_max_lag = float(os.getenv('DATABASE_REPLICA_MAX_LAG', 10))
+# for how long a replica that failed is left out
+replica_retry = float(os.getenv('DATABASE_REPLICA_RETRY', 30))
+replica_bind_prefix = 'replica_'
+primary_cookie = 'read_primary'
+
+'''
+Read replicas
+    the read-only views are decorated with replica_set.reads.
+    Their statements go to one of the replicas bound to the
+    application in SQLALCHEMY_BINDS, everything else, and any
+    flush, to the primary. A client that has just written gets
+    a cookie that sends its reads to the primary until the
+    replicas have caught up, so that it sees its own writes.
+    A read that fails to reach its replica is run again on the
+    primary.
+    The caches that keep what they read past the request, the
+    category and response caches, the question id index and the
+    question counters, fill themselves from the primary in a
+    primary_reads block: filled from a lagging replica they would
+    keep old rows after the cookie of the writer has expired.
+'''
+
+
+def replica_binds(app):
+    ''' the bind keys and URIs of the replicas of the application '''
+    return {
+        key: uri
+        for key, uri in (app.config.get('SQLALCHEMY_BINDS') or {}).items()
+        if key.startswith(replica_bind_prefix)
+    }
+
+
+class ReplicaSet:
+    ''' picks the replica of every read, in turn among the
+        replicas that are up
+    '''
+
+    def __init__(self, retry=replica_retry):
+        self.retry = retry
+        self._lock = threading.Lock()
+        self._down_until = {}
+        self._turn = itertools.count()
+        self.replica_reads = Counter()
+        self.primary_reads = 0
+        self.failovers = 0
+
+    def choose(self, binds):
+        now = time.monotonic()
+        with self._lock:
+            up = [
+                key for key in sorted(binds)
+                if self._down_until.get(binds[key], 0) <= now
+            ]
+        if not up:
+            return None
+        return up[next(self._turn) % len(up)]
+
+    def mark_down(self, uri):
+        with self._lock:
+            self._down_until[uri] = time.monotonic() + self.retry
+            self.failovers += 1
+
+    def _read(self, key, view, args, kwargs):
+        g.replica_bind = key
+        with self._lock:
+            if key is None:
+                self.primary_reads += 1
+            else:
+                self.replica_reads[key] += 1
+        return view(*args, **kwargs)
+
+    def reads(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            binds = replica_binds(current_app)
+            key = None
+            if binds and not reads_primary() and not g.get('primary_reads'):
+                key = self.choose(binds)
+            try:
+                return self._read(key, view, args, kwargs)
+            except (OperationalError, InterfaceError):
+                if key is None:
+                    raise
+                # the replica is unreachable, the view is read-only
+                # and runs again on the primary
+                self.mark_down(binds[key])
+                return self._read(None, view, args, kwargs)
+        return wrapper
+
+    def stats(self, app):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'primary_reads': self.primary_reads,
+                'failovers': self.failovers,
+                'replicas': {
+                    key: {
+                        'up': self._down_until.get(uri, 0) <= now,
+                        'reads': self.replica_reads[key]
+                    }
+                    for key, uri in sorted(replica_binds(app).items())
+                }
+            }
+
+
+replica_set = ReplicaSet()
+
+
+def reads_primary():
+    ''' whether the client of the request has written recently '''
+    return primary_cookie in request.cookies
+
+
+@contextlib.contextmanager
+def primary_reads():
+    ''' sends the reads of the block to the primary '''
+    if not has_app_context():
+        yield
+        return
+    previous = g.get('primary_reads', False)
+    g.primary_reads = True
+    try:
+        yield
+    finally:
+        g.primary_reads = previous
+
+
+class RoutingSession(SignallingSession):
+    ''' sends the statements of the views decorated with
+        replica_set.reads to their replica
+    '''
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        key = None
+        if has_app_context() and not g.get('primary_reads'):
+            key = g.get('replica_bind')
+        if key is not None and not self._flushing:
+            return self.db.get_engine(self.app, bind=key)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def remember_write(session):
+    if has_app_context():
+        g.database_written = True
+
+
+def init_replicas(app):
+    ''' gives the cookie that sends the reads of a client to the
+        primary to the clients that wrote
+    '''
+
+    @app.after_request
+    def stick_to_primary(response):
+        if g.get('database_written') and replica_binds(app):
+            response.set_cookie(
+                primary_cookie, '1', max_age=math.ceil(replica_max_lag),
+                httponly=True)
+        return response
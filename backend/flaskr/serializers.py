@@ -0,0 +1,91 @@
+import time
+from flask import current_app, jsonify, request
+
+from .instrumentation import current_timings
+from .models import db, Question
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+'''
+Serializers
+    the read-only endpoints select the question columns as
+    plain tuples, which skips building ORM objects and the
+    identity map, and encode them with orjson when it is
+    installed. The output is the same bytes as jsonify of
+    Question.format() dicts; whenever orjson could produce
+    something else, jsonify is used instead.
+'''
+
+question_columns = (
+    Question.id,
+    Question.question,
+    Question.answer,
+    Question.category,
+    Question.difficulty
+)
+question_fields = tuple(column.key for column in question_columns)
+columns_by_field = dict(zip(question_fields, question_columns))
+
+
+def question_rows(fields=question_fields):
+    ''' a query for the question columns, it accepts the same
+        filters and ordering as Question.query
+    '''
+    return db.session.query(*(columns_by_field[field] for field in fields))
+
+
+def format_rows(rows, fields=question_fields):
+    ''' the Question.format() dicts of column tuples '''
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def requested_names(argument, default):
+    ''' the names in a comma separated query string argument '''
+    value = request.args.get(argument)
+    if value is None:
+        return list(default)
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def selected_fields(names):
+    ''' the requested question fields in the order of the
+        columns, the id is always selected, the cursor of the
+        next page is read from it
+    '''
+    return tuple(
+        field for field in question_fields
+        if field == 'id' or field in names)
+
+
+def compact_output(app):
+    ''' whether jsonify writes sorted, compact and ASCII only
+        JSON, the only output that orjson can reproduce
+    '''
+    config = app.config
+    return (
+        config['JSON_SORT_KEYS'] and config['JSON_AS_ASCII']
+        and not config['JSONIFY_PRETTYPRINT_REGULAR'] and not app.debug)
+
+
+def json_response(data):
+    ''' a drop in replacement of jsonify for a dict '''
+    app = current_app._get_current_object()
+    if orjson is None or not compact_output(app):
+        return jsonify(data)
+    start = time.perf_counter()
+    try:
+        body = orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    except orjson.JSONEncodeError:
+        # integers past 64 bits or keys that are not strings
+        return jsonify(data)
+    if not body.isascii():
+        # jsonify escapes the characters outside of ASCII
+        return jsonify(data)
+    timings = current_timings()
+    if timings is not None:
+        timings.serialization += time.perf_counter() - start
+    return app.response_class(
+        body + b'\n', mimetype=app.config['JSONIFY_MIMETYPE'])
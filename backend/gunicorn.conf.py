@@ -0,0 +1,32 @@
+import multiprocessing
+import os
+
+'''
+gunicorn settings, start the server from the backend directory with
+
+    gunicorn 'flaskr:create_app()'
+
+The application is imported and created once in the master
+process and the workers are forked from it, so they start
+without importing anything. Set DATABASE_CREATE_SCHEMA=false
+and run `flask migrate` on deploy to also skip the schema
+round trip.
+'''
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:5000')
+workers = int(os.getenv(
+    'WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+
+def when_ready(server):
+    ''' closes the connections that creating the application
+        opened in the master, to the primary and to the replicas,
+        before any worker is forked
+    '''
+    from flaskr.models import db
+    from flaskr.replicas import replica_binds
+    app = server.app.wsgi()
+    db.get_engine(app).dispose()
+    for key in replica_binds(app):
+        db.get_engine(app, bind=key).dispose()